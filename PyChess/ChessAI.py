@@ -1,120 +1,597 @@
+import json
 import random
-pieceScore = {"K": 0, "Q": 24, "R": 12, "B": 8, "N": 8, "p": 2}
+import time
+from array import array
+try:
+    import numpy
+except ImportError: # only the batched evaluation (scoreBoards) needs it
+    numpy = None
+from ChessEval import pieceScore, scoreMaterial
+from ChessEngine import PIECE_TYPE, MOVE_ID_MASK, MOVE_PROMOTION_MASK, SQUARE_SCORES_BY_CODE
+import ChessBook
+import ChessTablebase
 CHECKMATE = 1000
 STALEMATE = 0
 DEPTH = 3
+MAX_DEPTH = 32 # iterative deepening limit when searching on a time or node budget
+TT_SIZE_MB = 16 # memory cap of the transposition table
+DEBUG_EVAL = False # cross-check the incremental board score against a full recompute at every leaf
+QUIESCENCE = True # resolve captures at depth-0 leaves instead of scoring them mid-exchange
+QUIESCENCE_CHECK_EVASIONS = True # search all evasions when a quiescence node is in check
+DELTA_MARGIN = 4 # captures that cannot lift the score to alpha by more than this are skipped
+RANDOM_TIE_BREAK = True # shuffle equally ordered moves, so the AI does not always play the same game
+MAX_PLY = 64
+MAX_MOVES = 256 # more than the legal moves of any position
 
-KnightScore = [
-    [-4, -2, 0, -2, -2, 0, -2, -4],
-    [-2, 0, 0, 0, 0, 0, 0, -2],
-    [-2, 1, 0, 1, 1, 0, 0, -2],
-    [0, 1, 1, 2, 2, 1, 1, 0],
-    [0, 1, 1, 2, 2, 1, 1, 0],
-    [-2, 0, 0, 1, 1, 0, 0, -2],
-    [-2, 0, 0, 0, 0, 0, 0, -2],
-    [-4, -2, 0, -2, -2, 0, -2, -4]
-]
-RookScore = [
-[0,0,0,2,2,0,0,0],
-[1,1,1,1,1,1,1,1],
-[0,0,0,0,0,0,0,0],
-[0,0,0,0,0,0,0,0],
-[0,0,0,0,0,0,0,0],
-[0,0,0,0,0,0,0,0],
-[1,1,1,1,1,1,1,1],
-[0,0,0,2,2,0,0,0]
-    ]
-PawnScoreW = [
-[0,0,0,0,0,0,0,0],
-[6,6,6,6,6,6,6,6],
-[3,3,3,3,3,3,3,3],
-[0,0,0,3,3,0,0,0],
-[0,0,2,3,3,0,0,0],
-[1,0,0,0,0,0,0,1],
-[1,1,1,0,0,1,1,1],
-[0,0,0,0,0,0,0,0]
-    ]
-PawnScoreB = [
-[0,0,0,0,0,0,0,0],
-[1,1,1,0,0,1,1,1],
-[1,0,0,0,0,0,0,1],
-[0,0,2,3,3,0,0,0],
-[0,0,0,3,3,0,0,0],
-[3,3,3,3,3,3,3,3],
-[6,6,6,6,6,6,6,6],
-[0,0,0,0,0,0,0,0]
-    ]
-BishopScore = [
-    [-2, 0, 0, 0, 0, 0, 0, -2],
-    [0, 2, 0, 1, 1, 0, 2, 0],
-    [0, 1, 1, 1, 1, 1, 1, 0],
-    [0, 0, 3, 2, 2, 3, 0, 0],
-    [0, 0, 3, 2, 2, 3, 0, 0],
-    [0, 1, 1, 1, 1, 1, 1, 0],
-    [0, 2, 0, 1, 1, 0, 2, 0],
-    [-2, 0, 0, 0, 0, 0, 0, -2]
-]
-QueenScore = [
-[-4,0,0,0,0,0,0,-4],
-[-1,0,1,0,0,0,0,-1],
-[-1,1,0,0,0,0,0,-1],
-[1,0,0,0,0,0,0,0],
-[1,0,0,0,0,0,0,0],
-[-1,1,0,0,0,0,0,-1],
-[-1,0,1,0,0,0,0,-1],
-[-4,0,0,0,0,0,0,-4]
-    ]
-KingScoreW = [
-[-6,-6,-6,-6,-6,-6,-6,-6],
-[-5,-5,-5,-5,-5,-5,-5,-5],
-[-4,-4,-4,-4,-4,-4,-4,-4],
-[-3,-3,-3,-3,-3,-3,-3,-3],
-[-2,-2,-2,-2,-2,-2,-2,-2],
-[-1,-1,-1,-1,-1,-1,-1,-1],
-[1,0,-1,0,0,-1,0,1],
-[2,3,0,0,0,0,3,2]
-    ]
-KingScoreB = [
-[2,3,0,0,0,0,3,2],
-[1,0,-1,0,0,-1,0,1],
-[-1,-1,-1,-1,-1,-1,-1,-1],
-[-2,-2,-2,-2,-2,-2,-2,-2],
-[-3,-3,-3,-3,-3,-3,-3,-3],
-[-4,-4,-4,-4,-4,-4,-4,-4],
-[-5,-5,-5,-5,-5,-5,-5,-5],
-[-6,-6,-6,-6,-6,-6,-6,-6],
-    ]
+## Move ordering: hash move, then captures by MVV-LVA, then killers, then quiet moves by history.
+## MVV-LVA reads the piece types straight from Move.packed, they run from pawn (1) to king (6).
+HASH_MOVE_ORDER = 1000000
+CAPTURE_ORDER = 100000
+KILLER_ORDER = 90000
+
+## Transposition table bound types
+EXACT = 1
+LOWERBOUND = 2 # score >= stored score (beta cutoff)
+UPPERBOUND = 3 # score <= stored score (failed low)
+
+
+class TranspositionTable:
+    ## Fixed-size table in parallel typed arrays (15 bytes per entry), indexed by the low bits of
+    ## GameState.zobristKey. A slot is overwritten when it is empty, holds the same position, was
+    ## stored by an older search, or was searched to a depth no greater than the new result.
+    entryBytes = 8 + 1 + 1 + 2 + 2 + 1 # key, depth, bound, score, moveID, age
+
+    def __init__(self, sizeMB=TT_SIZE_MB):
+        entries = 1
+        while entries * 2 * self.entryBytes <= sizeMB * 1024 * 1024:
+            entries *= 2
+        self.size = entries
+        self.mask = entries - 1
+        self.keys = array("Q", bytes(8 * entries))
+        self.depths = array("b", bytes(entries))
+        self.bounds = array("B", bytes(entries)) # 0 = empty slot
+        self.scores = array("h", bytes(2 * entries))
+        self.moves = array("H", bytes(2 * entries)) # Move.moveID + 1, 0 = no move
+        self.ages = array("B", bytes(entries))
+        self.age = 0
+        self.resetStats()
+
+    def resetStats(self):
+        self.probes = self.hits = self.stores = self.overwrites = self.rejected = 0
+
+    def newSearch(self):
+        self.age = (self.age + 1) & 0xFF
+
+    def clear(self):
+        self.bounds = array("B", bytes(self.size))
+        self.age = 0
+        self.resetStats()
+
+    def probe(self, key):
+        ## (depth, bound, score, moveID or None) of a stored position, or None
+        self.probes += 1
+        i = key & self.mask
+        if self.bounds[i] and self.keys[i] == key:
+            self.hits += 1
+            moveID = self.moves[i] - 1
+            return self.depths[i], self.bounds[i], self.scores[i], moveID if moveID >= 0 else None
+        return None
+
+    def store(self, key, depth, bound, score, move):
+        i = key & self.mask
+        if self.bounds[i] and self.keys[i] != key:
+            if self.ages[i] == self.age and self.depths[i] > depth:
+                self.rejected += 1
+                return
+            self.overwrites += 1
+        self.stores += 1
+        self.keys[i] = key
+        self.depths[i] = depth
+        self.bounds[i] = bound
+        self.scores[i] = score
+        self.moves[i] = move.moveID + 1 if move is not None else 0
+        self.ages[i] = self.age
+
+    def stats(self):
+        used = self.size - self.bounds.count(0)
+        return {"entries": self.size, "sizeMB": self.size * self.entryBytes / (1024 * 1024),
+                "used": used, "probes": self.probes, "hits": self.hits,
+                "hitRate": self.hits / self.probes if self.probes else 0.0,
+                "stores": self.stores, "overwrites": self.overwrites, "rejected": self.rejected}
+
+
+transpositionTable = TranspositionTable(TT_SIZE_MB)
+
+
+class SearchTimeout(Exception):
+    ## raised inside the search when the time or node budget runs out
+    pass
 
-def findRandomMoves(validMoves):
-    return validMoves[random.randint(0,len(validMoves)-1)] # (inclusive, inclusive)
 
-def findBestMove(gs, validMoves):
-    global nextMove
-    nextMove = None
-    random.shuffle(validMoves)
-    findMoveNegaMaxAlphaBeta(gs, validMoves,DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    return nextMove
-
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-    maxScore= -CHECKMATE
+openingBook = None # ChessBook.OpeningBook that findBestMove plays from before searching, see loadOpeningBook
+
+def loadOpeningBook(path):
+    ## play the moves of the book at path (made with ChessBook.py build); None goes back to searching every move
+    global openingBook
+    if openingBook is not None:
+        openingBook.close()
+    openingBook = ChessBook.OpeningBook(path) if path else None
+
+tablebases = None # ChessTablebase.Tablebases probed at the root and inside the search, see loadTablebases
+MATE_SCORE = CHECKMATE - MAX_PLY - ChessTablebase.MAX_PLIES # mates score from here up, CHECKMATE less the plies to mate
+
+def loadTablebases(directory):
+    ## probe the tables of directory (made with ChessTablebase.py generate); None turns probing off
+    global tablebases
+    if tablebases is not None:
+        tablebases.close()
+    tablebases = ChessTablebase.Tablebases(directory) if directory else None
+
+def tablebaseScore(result, ply=0):
+    ## search score, for the side to move ply plies below the root, of a tablebase (WIN/DRAW/LOSS, plies to mate)
+    outcome, plies = result
+    return outcome * (CHECKMATE - ply - plies)
+
+def scoreToTable(score, ply):
+    ## a mate score counts plies from the root; the table keeps them from the stored position instead
+    if score >= MATE_SCORE:
+        return score + ply
+    if score <= -MATE_SCORE:
+        return score - ply
+    return score
+
+def scoreFromTable(score, ply):
+    if score >= MATE_SCORE:
+        return score - ply
+    if score <= -MATE_SCORE:
+        return score + ply
+    return score
+
+def findTablebaseMove(gs, validMoves):
+    ## (move, score) of the quickest win, or the slowest loss, when the tablebases cover every move; else None
+    if tablebases is None or tablebases.probe(gs) is None:
+        return None
+    best = None
     for move in validMoves:
         gs.makeMove(move)
-        nextMoves = gs.getValidMove()
-        random.shuffle(nextMoves)
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
+        result = tablebases.probe(gs)
         gs.undoMove()
-        if maxScore > alpha:
+        if result is None:
+            return None
+        score = -tablebaseScore(result, 1)
+        if best is None or score > best[1]:
+            best = (move, score)
+    return best
+
+def findRandomMoves(validMoves):
+    return validMoves[random.randint(0,len(validMoves)-1)] # (inclusive, inclusive)
+
+def findBestMove(gs, validMoves, timeLimit=None, nodeLimit=None, maxDepth=None, seed=None, stopEvent=None):
+    ## Iterative deepening. timeLimit (seconds) and nodeLimit bound the search; the move of the last
+    ## completed depth is returned. Without a budget it searches to DEPTH, like before.
+    ## Setting stopEvent (a threading.Event) ends the search early.
+    ## searchInfo sums up the search, searchStats holds its counters (SearchContext.statistics).
+    global searchInfo, searchStats
+    bestMove = None
+    stopped = False
+    if openingBook is not None:
+        bookMove = openingBook.pickMove(gs, validMoves, random.Random(seed) if seed is not None else random)
+        if bookMove is not None:
+            searchInfo = {"depth": 0, "score": 0, "nodes": 0, "time": 0.0, "book": True}
+            searchStats = dict(searchInfo)
+            bestMove = bookMove
+    if bestMove is None:
+        context = SearchContext(seed=seed, stopEvent=stopEvent)
+        bestMove = context.search(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+        searchInfo = context.info
+        searchStats = context.statistics()
+        stopped = context.stopped
+    if bestMove is not None and not stopped: # a cancelled search or one without a move reports nothing
+        for hook in searchHooks:
+            hook(gs, bestMove, searchStats)
+    return bestMove
+
+searchStats = {}
+searchHooks = [] # called as hook(gs, bestMove, searchStats) after every findBestMove that was not stopped; none by default
+
+def writeSearchStats(path, stats, **fields):
+    ## appends stats, and any extra fields, to path as one JSON line
+    with open(path, "a") as f:
+        f.write(json.dumps(dict(fields, **stats)) + "\n")
+
+
+class SearchContext:
+    ## All state of one search: budget, node count, killers, history and the best root move. Nothing
+    ## is kept in module globals, so several searches can run side by side (the games of a match, the
+    ## positions of a batch). Equal moves are shuffled with a generator seeded by seed.
+    ## stop() or setting stopEvent, from another thread, ends the search at the next budget check, as if
+    ## it ran out of time.
+
+    def __init__(self, table=None, seed=None, stopEvent=None):
+        self.transpositionTable = table if table is not None else transpositionTable
+        self.random = random.Random(seed)
+        self.stopEvent = stopEvent
+        self.stopped = False
+        self.onDepth = None # called with the context after every completed depth
+        self.nextMove = None
+        self.nodes = 0
+        self.nodeLimit = None
+        self.deadline = None
+        self.rootBestMoveID = None
+        self.info = {"depth": 0, "score": 0, "nodes": 0, "time": 0.0}
+        self.depthStats = [] # one entry per completed depth, see recordDepth
+        self.tableProbes = self.tableHits = 0 # table counters when the search started
+        self.resetMoveOrdering()
+
+    def search(self, gs, validMoves, timeLimit=None, nodeLimit=None, maxDepth=None):
+        if maxDepth is None:
+            maxDepth = DEPTH if timeLimit is None and nodeLimit is None else MAX_DEPTH
+        startTime = time.perf_counter()
+        self.deadline = startTime + timeLimit if timeLimit is not None else None
+        self.nodeLimit = nodeLimit
+        rootLength = len(gs.moveLog)
+        self.tableProbes = self.transpositionTable.probes
+        self.tableHits = self.transpositionTable.hits
+        tablebaseMove = findTablebaseMove(gs, validMoves)
+        if tablebaseMove is not None:
+            self.nextMove, score = tablebaseMove
+            self.info = {"depth": 0, "score": score, "nodes": 0, "time": time.perf_counter() - startTime, "tablebase": True}
+            return self.nextMove
+        self.transpositionTable.newSearch()
+        bestMove = None
+        for depth in range(1, maxDepth + 1):
+            self.nextMove = None
+            try:
+                score = self.searchRoot(gs, validMoves, depth, 1 if gs.whiteToMove else -1)
+            except SearchTimeout:
+                while len(gs.moveLog) > rootLength:
+                    gs.undoMove()
+                if bestMove is None: # not even depth 1 finished, take the best move seen so far
+                    bestMove = self.nextMove
+                break
+            if self.nextMove is not None:
+                bestMove = self.nextMove
+            self.info = {"depth": depth, "score": score, "nodes": self.nodes, "time": time.perf_counter() - startTime}
+            self.recordDepth(depth, score, bestMove)
+            if bestMove is not None: # previous best move goes first in the next iteration
+                self.rootBestMoveID = bestMove.moveID
+            if self.onDepth is not None:
+                self.onDepth(self)
+            if abs(score) >= MATE_SCORE:
+                break
+            if timeLimit is not None and time.perf_counter() - startTime > timeLimit / 2:
+                break # the next depth would not finish in time
+        self.info["nodes"] = self.nodes
+        self.info["time"] = time.perf_counter() - startTime
+        self.info["betaCutoffs"] = self.betaCutoffs
+        self.info["firstMoveCutoffRate"] = self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0
+        return bestMove
+
+    def resetMoveOrdering(self):
+        self.killerMoves = [[None, None] for _ in range(MAX_PLY)] # two moveIDs per ply
+        self.historyTable = [0] * 4096 # startSquare * 64 + endSquare
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0
+        self.cutoffsByIndex = [0] * MAX_MOVES # beta cutoffs by the index of the refuting move
+
+    def orderMoves(self, moves, ply, hashMoveID):
+        killers = self.killerMoves[ply] if ply < MAX_PLY else (None, None)
+        historyTable = self.historyTable
+        tieBreak = self.random.random
+        def orderScore(move):
+            packed = move.packed
+            moveID = packed & MOVE_ID_MASK
+            if moveID == hashMoveID:
+                return HASH_MOVE_ORDER
+            if packed >> 17 & PIECE_TYPE: # capture
+                score = CAPTURE_ORDER + 10 * (packed >> 17 & PIECE_TYPE) - (packed >> 12 & PIECE_TYPE)
+            elif packed & MOVE_PROMOTION_MASK:
+                score = CAPTURE_ORDER
+            elif moveID == killers[0]:
+                score = KILLER_ORDER + 1
+            elif moveID == killers[1]:
+                score = KILLER_ORDER
+            else:
+                score = historyTable[moveID]
+            if RANDOM_TIE_BREAK:
+                score += tieBreak()
+            return score
+        moves.sort(key=orderScore, reverse=True)
+
+    def countBetaCutoff(self, moveIndex):
+        self.betaCutoffs += 1
+        self.cutoffsByIndex[moveIndex] += 1
+        if moveIndex == 0:
+            self.firstMoveCutoffs += 1
+
+    def updateQuietCutoff(self, move, depth, ply):
+        ## a quiet move refuted this node: remember it as a killer and credit its from/to squares
+        killerMoves = self.killerMoves
+        if ply < MAX_PLY and killerMoves[ply][0] != move.moveID:
+            killerMoves[ply][1] = killerMoves[ply][0]
+            killerMoves[ply][0] = move.moveID
+        historyTable = self.historyTable
+        i = move.moveID # start * 64 + end
+        historyTable[i] += depth * depth
+        if historyTable[i] >= KILLER_ORDER: # keep history below the killer band
+            for j in range(4096):
+                historyTable[j] //= 2
+
+    def stop(self):
+        self.stopped = True
+
+    def recordDepth(self, depth, score, bestMove):
+        ## Nodes, time and nps of the iteration that completed depth. The effective branching factor is
+        ## the ratio of its nodes to the nodes of the iteration before.
+        previous = self.depthStats[-1] if self.depthStats else None
+        nodes = self.nodes - (previous["totalNodes"] if previous else 0)
+        elapsed = self.info["time"] - (previous["totalTime"] if previous else 0.0)
+        self.depthStats.append({"depth": depth, "score": score, "move": bestMove.getUciNotation() if bestMove else None,
+                                "nodes": nodes, "time": elapsed, "nps": int(nodes / elapsed) if elapsed > 0 else 0,
+                                "branching": nodes / previous["nodes"] if previous and previous["nodes"] else None,
+                                "totalNodes": self.nodes, "totalTime": self.info["time"]})
+
+    def statistics(self):
+        ## JSON-ready counters of the search: budget use, cutoffs by move index, table hits, per-depth nodes
+        table = self.transpositionTable
+        probes = table.probes - self.tableProbes
+        hits = table.hits - self.tableHits
+        lastIndex = max((i for i, count in enumerate(self.cutoffsByIndex) if count), default=-1)
+        elapsed = self.info["time"]
+        return {"depth": self.info["depth"], "score": self.info["score"], "nodes": self.nodes, "time": elapsed,
+                "nps": int(self.nodes / elapsed) if elapsed > 0 else 0, "tablebase": self.info.get("tablebase", False),
+                "betaCutoffs": self.betaCutoffs,
+                "firstMoveCutoffRate": self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else 0.0,
+                "cutoffsByMoveIndex": self.cutoffsByIndex[:lastIndex + 1],
+                "tableProbes": probes, "tableHits": hits, "tableHitRate": hits / probes if probes else 0.0,
+                "depths": self.depthStats}
+
+    def checkSearchBudget(self):
+        if self.stopped or (self.stopEvent is not None and self.stopEvent.is_set()):
+            self.stopped = True
+            raise SearchTimeout()
+        if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+            raise SearchTimeout()
+        if self.deadline is not None and time.perf_counter() >= self.deadline:
+            raise SearchTimeout()
+
+    def principalVariation(self, gs, bestMove, maxLength=MAX_PLY):
+        ## bestMove followed by the hash moves of the table, while they are legal and no position repeats
+        pv = []
+        seen = set()
+        move = bestMove
+        while move is not None and len(pv) < maxLength and gs.zobristKey not in seen:
+            seen.add(gs.zobristKey)
+            pv.append(move)
+            gs.makeMove(move)
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            move = None
+            if entry is not None and entry[3] is not None:
+                for nextMove in gs.getValidMove():
+                    if nextMove.moveID == entry[3]:
+                        move = nextMove
+                        break
+        for _ in pv:
+            gs.undoMove()
+        return pv
+
+    def searchRoot(self, gs, validMoves, depth, turnMultiplier):
+        ## ply 0 of findMoveNegaMaxAlphaBeta, which also keeps the best move
+        self.nodes += 1
+        hashMoveID = self.rootBestMoveID
+        if hashMoveID is None:
+            entry = self.transpositionTable.probe(gs.zobristKey)
+            if entry is not None:
+                hashMoveID = entry[3]
+        self.orderMoves(validMoves, 0, hashMoveID)
+        maxScore = -CHECKMATE
+        for move in validMoves:
             alpha = maxScore
-        if alpha >= beta:
-            break
-    return maxScore
+            gs.makeMove(move)
+            if depth > 1 or not QUIESCENCE:
+                nextMoves = gs.getValidMove()
+            else:
+                nextMoves = None
+                gs.checkMate = gs.staleMate = False
+            score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -CHECKMATE, -alpha, -turnMultiplier, 1)
+            gs.undoMove()
+            if score > maxScore or self.nextMove is None: # when every move is mated, still take one
+                maxScore = score
+                self.nextMove = move
+        self.transpositionTable.store(gs.zobristKey, depth, EXACT, maxScore, self.nextMove)
+        return maxScore
+
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier, ply):
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.checkSearchBudget()
+        if gs.halfmoveClock >= 100 and validMoves is None and gs.inCheck():
+            validMoves = gs.getValidMove() # a quiescence leaf does not know yet whether the fiftieth move mated
+        if (gs.halfmoveClock >= 100 and not gs.checkMate) or gs.isRepetition(): # a repetition in the tree is a draw
+            return STALEMATE
+        if tablebases is not None:
+            result = tablebases.probe(gs)
+            if result is not None:
+                return tablebaseScore(result, ply)
+        if depth == 0:
+            if gs.checkMate:
+                return -CHECKMATE + ply
+            if QUIESCENCE and not gs.staleMate:
+                return self.quiescenceSearch(gs, alpha, beta, turnMultiplier, ply)
+            return turnMultiplier * scoreBoard(gs)
+        if not validMoves: # the loop below would score a stalemate as lost
+            return -CHECKMATE + ply if gs.inCheck() else STALEMATE
+        alphaOrig = alpha
+        hashMoveID = None
+        entry = self.transpositionTable.probe(gs.zobristKey)
+        if entry is not None:
+            entryDepth, bound, score, hashMoveID = entry
+            score = scoreFromTable(score, ply)
+            if entryDepth >= depth:
+                if bound == EXACT:
+                    return score
+                elif bound == LOWERBOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+        self.orderMoves(validMoves, ply, hashMoveID)
+        maxScore= -CHECKMATE
+        bestMove = None
+        for i in range(len(validMoves)):
+            move = validMoves[i]
+            gs.makeMove(move)
+            if depth > 1 or not QUIESCENCE:
+                nextMoves = gs.getValidMove()
+            else: # the child is a quiescence leaf, it builds its own capture list
+                nextMoves = None
+                gs.checkMate = gs.staleMate = False
+            score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier, ply + 1)
+            gs.undoMove()
+            if score > maxScore:
+                maxScore = score
+                bestMove = move
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                self.countBetaCutoff(i)
+                if move.pieceCaptured == "--" and not move.isPawnPromotion:
+                    self.updateQuietCutoff(move, depth, ply)
+                break
+        if maxScore <= alphaOrig:
+            bound = UPPERBOUND
+        elif maxScore >= beta:
+            bound = LOWERBOUND
+        else:
+            bound = EXACT
+        self.transpositionTable.store(gs.zobristKey, depth, bound, scoreToTable(maxScore, ply), bestMove)
+        return maxScore
+
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier, ply):
+        ## Captures only (plus promotions), so a leaf is never scored in the middle of an exchange.
+        ## The side to move may stand pat on the static score; in check all evasions are searched.
+        self.nodes += 1
+        if self.nodes & 255 == 0:
+            self.checkSearchBudget()
+        if tablebases is not None:
+            result = tablebases.probe(gs)
+            if result is not None:
+                return tablebaseScore(result, ply)
+        inCheck = QUIESCENCE_CHECK_EVASIONS and gs.inCheck()
+        deltaPruning = not inCheck
+        if inCheck:
+            moves = gs.getValidMove()
+            if len(moves) == 0:
+                return -CHECKMATE + ply
+            maxScore = -CHECKMATE
+        else:
+            standPat = turnMultiplier * incrementalScore(gs)
+            if standPat >= beta:
+                return standPat
+            if deltaPruning and standPat + pieceScore["Q"] + DELTA_MARGIN <= alpha: # not even winning a queen helps
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            maxScore = standPat
+            moves = gs.getValidCaptures()
+        self.orderMoves(moves, ply, None)
+        for move in moves:
+            if deltaPruning and not move.isPawnPromotion and \
+                    standPat + pieceScore[move.pieceCaptured[1]] + DELTA_MARGIN <= alpha: # delta pruning
+                continue
+            gs.makeMove(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+            gs.undoMove()
+            if score > maxScore:
+                maxScore = score
+            if maxScore > alpha:
+                alpha = maxScore
+            if alpha >= beta:
+                break
+        return maxScore
+
+
+class SearchProfiler:
+    ## with SearchProfiler(gs) as profiler: ... splits the time of the block between move generation,
+    ## make/undo and evaluation. Inside the block the methods of gs and the evaluation functions of this
+    ## module are wrapped in timers; nothing is wrapped outside it, so unprofiled searches pay nothing.
+    ## Times include the cost of the timers.
+    wrappedMethods = {"moveGeneration": ("getValidMove", "getValidCaptures", "inCheck"), "makeUndo": ("makeMove", "undoMove")}
+    wrappedFunctions = {"evaluation": ("incrementalScore",)}
+
+    def __init__(self, gs):
+        self.gs = gs
+        self.calls = {"moveGeneration": 0, "makeUndo": 0, "evaluation": 0}
+        self.seconds = dict.fromkeys(self.calls, 0.0)
+        self.saved = {}
+        self.elapsed = 0.0
+
+    def timed(self, section, function):
+        calls = self.calls
+        seconds = self.seconds
+        clock = time.perf_counter
+        def timedFunction(*args):
+            start = clock()
+            result = function(*args)
+            seconds[section] += clock() - start
+            calls[section] += 1
+            return result
+        return timedFunction
+
+    def __enter__(self):
+        for section, names in self.wrappedMethods.items():
+            for name in names:
+                setattr(self.gs, name, self.timed(section, getattr(self.gs, name)))
+        moduleGlobals = globals()
+        for section, names in self.wrappedFunctions.items():
+            for name in names:
+                self.saved[name] = moduleGlobals[name]
+                moduleGlobals[name] = self.timed(section, moduleGlobals[name])
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed += time.perf_counter() - self.startTime
+        for names in self.wrappedMethods.values():
+            for name in names:
+                delattr(self.gs, name) # the class methods show through again
+        globals().update(self.saved)
+        return False
+
+    def report(self):
+        ## {"time", "leafEvaluations", and calls, seconds and share of the time of every section}
+        report = {"time": self.elapsed, "leafEvaluations": self.calls["evaluation"]}
+        for section in self.calls:
+            report[section] = {"calls": self.calls[section], "seconds": self.seconds[section],
+                               "share": self.seconds[section] / self.elapsed if self.elapsed > 0 else 0.0}
+        other = self.elapsed - sum(self.seconds.values())
+        report["other"] = {"seconds": other, "share": other / self.elapsed if self.elapsed > 0 else 0.0}
+        return report
+
+
+def incrementalScore(gs):
+    if DEBUG_EVAL:
+        fullScore = scoreMaterial(gs.board)
+        if fullScore != gs.boardScore:
+            raise RuntimeError(f"incremental score {gs.boardScore} != full recompute {fullScore} after {gs.moveLog}")
+    return gs.boardScore
+
+## Batched evaluation: SQUARE_SCORE_ARRAY[code, square] is the material + piece-square score of a piece
+## code on a square from white's side, so the score of N boards is one gather and one sum over an
+## (N, 64) array of square codes instead of N passes of the interpreter. It is for scoring many positions
+## at once (a set of FENs, a game record); the search does not use it, since the incremental boardScore
+## already makes a leaf O(1) and a batch would score the leaves a cutoff skips.
+SQUARE_SCORE_ARRAY = numpy.array(SQUARE_SCORES_BY_CODE, dtype=numpy.int32) if numpy is not None else None
+SQUARE_INDEXES = numpy.arange(64) if numpy is not None else None
+
+def encodeBoards(boards):
+    ## (N, 64) uint8 array of N GameState.squares (or their bytes)
+    return numpy.frombuffer(b"".join(boards), dtype=numpy.uint8).reshape(-1, 64)
+
+def scoreBoards(codes):
+    ## scoreMaterial, from white's side, of every row of an (N, 64) array of square codes
+    return SQUARE_SCORE_ARRAY[codes, SQUARE_INDEXES].sum(axis=1)
 
 def scoreBoard(gs):
     if gs.checkMate:
@@ -124,42 +601,4 @@ def scoreBoard(gs):
             return CHECKMATE
     elif gs.staleMate:
         return STALEMATE
-    score = 0
-    for row in range(len(gs.board)):
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-
-
-            if square != "--":
-                piecePositionScore = 0
-                if square[0] == "w":
-
-                    if square[1] == "N":
-                        piecePositionScore = KnightScore[row][col]
-                    elif square[1] == "K":
-                        piecePositionScore = KingScoreW[row][col]
-                    elif square[1] == "B":
-                        piecePositionScore = BishopScore[row][col]
-                    elif square[1] == "R":
-                        piecePositionScore = RookScore[row][col]
-                    elif square[1] == "p":
-                        piecePositionScore = PawnScoreW[row][col]
-                    elif square[1] == "Q":
-                        piecePositionScore = QueenScore[row][col]
-                    score += (pieceScore[square[1]] + piecePositionScore)
-                elif square[0] == "b":
-                    if square[1] == "N":
-                        piecePositionScore = KnightScore[row][col]
-                    elif square[1] == "K":
-                        piecePositionScore = KingScoreB[row][col]
-                    elif square[1] == "B":
-                        piecePositionScore = BishopScore[row][col]
-                    elif square[1] == "R":
-                        piecePositionScore = RookScore[row][col]
-                    elif square[1] == "p":
-                        piecePositionScore = PawnScoreB[row][col]
-                    elif square[1] == "Q":
-                        piecePositionScore = QueenScore[row][col]
-                    score -= (pieceScore[square[1]] + piecePositionScore)
-    return score
-
+    return incrementalScore(gs)
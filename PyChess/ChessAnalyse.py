@@ -0,0 +1,128 @@
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from collections import deque
+
+import ChessAI
+import ChessEngine
+import ChessBitboard
+
+## Headless batch analysis: one FEN per input line in, one JSON line per position out, in input order.
+## Positions are spread over a pool of worker processes, each searching one position at a time on a
+## single core. Only a few positions per worker are read ahead, so inputs of any size stream through.
+IN_FLIGHT_PER_WORKER = 4 # positions handed to the pool ahead of the one being written
+DEFAULT_NODES = 20000 # node budget per position when no budget is given
+
+def readPositions(lines):
+    ## (line number, FEN) of every line that is not blank or a # comment; anything after ";" is ignored (EPD opcodes)
+    for lineNumber, line in enumerate(lines, 1):
+        fen = line.split(";")[0].strip()
+        if fen and not fen.startswith("#"):
+            yield lineNumber, fen
+
+def analysePosition(task):
+    ## runs in a worker: the result line of one position, an error line when it cannot be analysed
+    try:
+        return searchPosition(task)
+    except Exception as e: # one broken position must not end the batch
+        return {"line": task[0], "fen": task[1], "error": f"{type(e).__name__}: {e}"}
+
+def searchPosition(task):
+    ## search one position on an empty transposition table, so the result does not depend on which
+    ## worker got it or what that worker searched before
+    lineNumber, fen, timeLimit, nodeLimit, maxDepth, backend, seed, withStats = task
+    result = {"line": lineNumber, "fen": fen}
+    gs = ChessBitboard.BitboardGameState() if backend == "bitboard" else ChessEngine.GameState()
+    try:
+        gs.loadFen(fen)
+    except (ValueError, KeyError, IndexError) as e:
+        result["error"] = f"bad FEN: {e}"
+        return result
+    startTime = time.perf_counter()
+    validMoves = gs.getValidMove()
+    if len(validMoves) == 0:
+        result.update({"move": None, "score": -ChessAI.CHECKMATE if gs.checkMate else ChessAI.STALEMATE,
+                       "depth": 0, "nodes": 0, "time": time.perf_counter() - startTime,
+                       "result": "checkmate" if gs.checkMate else "stalemate"})
+        return result
+    ChessAI.transpositionTable.clear()
+    context = ChessAI.SearchContext(seed=seed)
+    bestMove = context.search(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+    result.update({"move": bestMove.getUciNotation() if bestMove is not None else None,
+                   "san": gs.getSanNotation(bestMove, validMoves) if bestMove is not None else None,
+                   "score": context.info["score"],
+                   "depth": context.info["depth"], "nodes": context.info["nodes"], "time": context.info["time"]})
+    if bestMove is None:
+        result["error"] = "no move found within the budget"
+    if withStats:
+        result["stats"] = context.statistics()
+    return result
+
+def analyse(lines, output, workers=1, timeLimit=None, nodeLimit=None, maxDepth=None, backend="bitboard", seed=None,
+            withStats=False):
+    ## analyses every position of lines and writes one JSON line per position to output; returns the count.
+    ## withStats adds the search statistics (SearchContext.statistics) to every line.
+    tasks = ((lineNumber, fen, timeLimit, nodeLimit, maxDepth, backend, seed, withStats)
+             for lineNumber, fen in readPositions(lines))
+    count = 0
+    if workers <= 1:
+        for task in tasks:
+            writeResult(output, analysePosition(task))
+            count += 1
+        return count
+    pool = multiprocessing.Pool(workers)
+    try:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.apply_async(analysePosition, (task,)))
+            if len(pending) >= workers * IN_FLIGHT_PER_WORKER:
+                writeResult(output, pending.popleft().get())
+                count += 1
+        while pending:
+            writeResult(output, pending.popleft().get())
+            count += 1
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+    return count
+
+def writeResult(output, result):
+    output.write(json.dumps(result) + "\n")
+    output.flush()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyse FEN positions, one per line, and print JSON lines")
+    parser.add_argument("input", nargs="?", default="-", help="file of FEN lines, - for stdin")
+    parser.add_argument("--output", default="-", help="file to write the JSON lines to, - for stdout")
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+    parser.add_argument("--time", type=float, help="seconds per position")
+    parser.add_argument("--nodes", type=int, help="nodes per position")
+    parser.add_argument("--depth", type=int, help="maximum depth per position")
+    parser.add_argument("--backend", choices=["bitboard", "board"], default="bitboard")
+    parser.add_argument("--seed", type=int, default=0, help="tie-break seed, so reruns give the same moves")
+    parser.add_argument("--tablebases", help="directory of endgame tables to probe")
+    parser.add_argument("--stats", action="store_true", help="add the search statistics to every line")
+    args = parser.parse_args(argv)
+    nodeLimit = args.nodes
+    if args.tablebases:
+        ChessAI.loadTablebases(args.tablebases) # before the pool starts, so the workers have them
+    if args.time is None and args.nodes is None and args.depth is None:
+        nodeLimit = DEFAULT_NODES
+    source = sys.stdin if args.input == "-" else open(args.input)
+    output = sys.stdout if args.output == "-" else open(args.output, "w")
+    try:
+        startTime = time.perf_counter()
+        count = analyse(source, output, args.workers, args.time, nodeLimit, args.depth, args.backend, args.seed, args.stats)
+        print(f"analysed {count} positions in {time.perf_counter() - startTime:.1f}s", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,312 @@
+import ChessEngine
+
+## Bitboard backend: same API as ChessEngine.GameState (getValidMove / makeMove / undoMove),
+## but move generation works on 64-bit occupancy masks. Square index = row * 8 + col,
+## so bit 0 is a8 and bit 63 is h1.
+FULL = 0xFFFFFFFFFFFFFFFF
+PIECES = ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]
+SQUARE_BB = [1 << sq for sq in range(64)]
+SQ_RC = ChessEngine.SQ_RC
+PROMOTION_SQUARES = 0xFF | 0xFF << 56 # rows 0 and 7
+
+
+def _onBoard(r, c):
+    return 0 <= r < 8 and 0 <= c < 8
+
+
+def _stepTable(steps):
+    table = []
+    for sq in range(64):
+        r, c = SQ_RC[sq]
+        bb = 0
+        for dr, dc in steps:
+            if _onBoard(r + dr, c + dc):
+                bb |= SQUARE_BB[(r + dr) * 8 + c + dc]
+        table.append(bb)
+    return table
+
+
+def _rayTable(dr, dc):
+    table = []
+    for sq in range(64):
+        r, c = SQ_RC[sq]
+        bb = 0
+        r, c = r + dr, c + dc
+        while _onBoard(r, c):
+            bb |= SQUARE_BB[r * 8 + c]
+            r, c = r + dr, c + dc
+        table.append(bb)
+    return table
+
+
+KNIGHT_ATTACKS = _stepTable(((-2, -1), (-2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2), (2, -1), (2, 1)))
+KING_ATTACKS = _stepTable(((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)))
+PAWN_ATTACKS = {"w": _stepTable(((-1, -1), (-1, 1))), "b": _stepTable(((1, -1), (1, 1)))}
+
+## (ray table, True if the ray runs towards higher square indices)
+ROOK_RAYS = [(_rayTable(-1, 0), False), (_rayTable(0, -1), False), (_rayTable(1, 0), True), (_rayTable(0, 1), True)]
+BISHOP_RAYS = [(_rayTable(-1, -1), False), (_rayTable(-1, 1), False), (_rayTable(1, -1), True), (_rayTable(1, 1), True)]
+
+
+def _betweenTable():
+    table = [[0] * 64 for _ in range(64)]
+    for rays in (ROOK_RAYS, BISHOP_RAYS):
+        for ray, _ in rays:
+            for a in range(64):
+                targets = ray[a]
+                while targets:
+                    lsb = targets & -targets
+                    b = lsb.bit_length() - 1
+                    targets ^= lsb
+                    table[a][b] = ray[a] & ~ray[b] & ~SQUARE_BB[b]
+    return table
+
+
+BETWEEN = _betweenTable()  # squares strictly between two aligned squares, else 0
+
+
+def slidingAttacks(sq, occupied, rays):
+    attacks = 0
+    for ray, positive in rays:
+        bb = ray[sq]
+        blockers = bb & occupied
+        if blockers:
+            if positive:
+                blocker = (blockers & -blockers).bit_length() - 1
+            else:
+                blocker = blockers.bit_length() - 1
+            bb ^= ray[blocker]
+        attacks |= bb
+    return attacks
+
+
+def rookAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, ROOK_RAYS)
+
+
+def bishopAttacks(sq, occupied):
+    return slidingAttacks(sq, occupied, BISHOP_RAYS)
+
+
+def bitScan(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+class BitboardGameState(ChessEngine.GameState):
+
+    def __init__(self):
+        ChessEngine.GameState.__init__(self)
+        self.pieceBitboards = {piece: 0 for piece in PIECES}
+        self.colorBitboards = {"w": 0, "b": 0}
+        self.squarePieces = ["--"] * 64
+        self.occupied = 0
+        for sq in range(64):
+            self.setSquare(sq, ChessEngine.PIECE_NAMES[self.squares[sq]])
+
+    def setSquare(self, sq, piece):
+        old = self.squarePieces[sq]
+        if old == piece:
+            return
+        bit = SQUARE_BB[sq]
+        if old != "--":
+            self.pieceBitboards[old] ^= bit
+            self.colorBitboards[old[0]] ^= bit
+            self.occupied ^= bit
+        if piece != "--":
+            self.pieceBitboards[piece] |= bit
+            self.colorBitboards[piece[0]] |= bit
+            self.occupied |= bit
+        self.squarePieces[sq] = piece
+
+    def syncSquares(self, squares):
+        for sq in squares:
+            self.setSquare(sq, ChessEngine.PIECE_NAMES[self.squares[sq]])
+
+    def loadFen(self, fen):
+        ChessEngine.GameState.loadFen(self, fen)
+        self.syncSquares(range(64))
+
+    def syncMove(self, packed):
+        ## resync the squares a move touches, without building a list of them
+        names = ChessEngine.PIECE_NAMES
+        squares = self.squares
+        start = packed >> 6 & 63
+        end = packed & 63
+        self.setSquare(start, names[squares[start]])
+        self.setSquare(end, names[squares[end]])
+        if packed & ChessEngine.MOVE_ENPASSANT:
+            sq = start & 56 | end & 7
+            self.setSquare(sq, names[squares[sq]])
+        if packed & ChessEngine.MOVE_CASTLE:
+            rookStart, rookEnd = (end + 1, end - 1) if end - start == 2 else (end - 2, end + 1)
+            self.setSquare(rookStart, names[squares[rookStart]])
+            self.setSquare(rookEnd, names[squares[rookEnd]])
+
+    def makeMove(self, move):
+        ChessEngine.GameState.makeMove(self, move)
+        self.syncMove(move.packed)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            packed = self.moveLog[-1].packed
+            ChessEngine.GameState.undoMove(self)
+            self.syncMove(packed)
+
+    def attackersTo(self, sq, color, occupied):
+        bbs = self.pieceBitboards
+        queens = bbs[color + "Q"]
+        return ((KNIGHT_ATTACKS[sq] & bbs[color + "N"])
+                | (KING_ATTACKS[sq] & bbs[color + "K"])
+                | (PAWN_ATTACKS["b" if color == "w" else "w"][sq] & bbs[color + "p"])
+                | (rookAttacks(sq, occupied) & (bbs[color + "R"] | queens))
+                | (bishopAttacks(sq, occupied) & (bbs[color + "B"] | queens)))
+
+    def inCheck(self):
+        us, them = ("w", "b") if self.whiteToMove else ("b", "w")
+        kingSq = bitScan(self.pieceBitboards[us + "K"])
+        return self.attackersTo(kingSq, them, self.occupied) != 0
+
+    def squareUnderAttack(self, r, c):
+        them = "b" if self.whiteToMove else "w"
+        return self.attackersTo(r * 8 + c, them, self.occupied) != 0
+
+    def pinnedPieces(self, kingSq, us, them):
+        ## returns {square: mask of squares the pinned piece may still move to}
+        pins = {}
+        bbs = self.pieceBitboards
+        ours = self.colorBitboards[us]
+        for rays, sliders in ((ROOK_RAYS, bbs[them + "R"] | bbs[them + "Q"]),
+                              (BISHOP_RAYS, bbs[them + "B"] | bbs[them + "Q"])):
+            if not sliders:
+                continue
+            for ray, positive in rays:
+                blockers = ray[kingSq] & self.occupied
+                if not blockers:
+                    continue
+                first = bitScan(blockers) if positive else blockers.bit_length() - 1
+                if not ours & SQUARE_BB[first]:
+                    continue
+                blockers &= ~SQUARE_BB[first]
+                if not blockers:
+                    continue
+                second = bitScan(blockers) if positive else blockers.bit_length() - 1
+                if sliders & SQUARE_BB[second]:
+                    pins[first] = BETWEEN[kingSq][second] | SQUARE_BB[second]
+        return pins
+
+    def getLegalMoves(self):
+        ## (legal moves, in check); with self.capturesOnly set only captures and promotions are built
+        moves = []
+        squares = self.squares
+        Move = ChessEngine.Move
+        bbs = self.pieceBitboards
+        us, them = ("w", "b") if self.whiteToMove else ("b", "w")
+        ours = self.colorBitboards[us]
+        theirs = self.colorBitboards[them]
+        occupied = self.occupied
+        kingSq = bitScan(bbs[us + "K"])
+        checkers = self.attackersTo(kingSq, them, occupied)
+        if checkers & (checkers - 1):  # double check: only the king can move
+            targetMask = 0
+        elif checkers:
+            targetMask = BETWEEN[kingSq][bitScan(checkers)] | checkers
+        else:
+            targetMask = FULL
+        pins = self.pinnedPieces(kingSq, us, them) if targetMask else {}
+        quietMask = theirs if self.capturesOnly else FULL
+        pushMask = PROMOTION_SQUARES if self.capturesOnly else FULL
+
+        if targetMask:
+            ## pawns
+            forward = -8 if us == "w" else 8
+            startRow = 6 if us == "w" else 1
+            epSq = self.enpassantPossible[0] * 8 + self.enpassantPossible[1] if self.enpassantPossible else -1
+            pawnAttacks = PAWN_ATTACKS[us]
+            pawns = bbs[us + "p"]
+            while pawns:
+                lsb = pawns & -pawns
+                pawns ^= lsb
+                sq = lsb.bit_length() - 1
+                mask = targetMask & pins.get(sq, FULL)
+                one = sq + forward
+                if not occupied & SQUARE_BB[one]:
+                    if mask & pushMask & SQUARE_BB[one]:
+                        moves.append(Move(SQ_RC[sq], SQ_RC[one], squares))
+                    two = one + forward
+                    if SQ_RC[sq][0] == startRow and not occupied & SQUARE_BB[two] and mask & pushMask & SQUARE_BB[two]:
+                        moves.append(Move(SQ_RC[sq], SQ_RC[two], squares))
+                captures = pawnAttacks[sq] & theirs & mask
+                while captures:
+                    bit = captures & -captures
+                    captures ^= bit
+                    moves.append(Move(SQ_RC[sq], SQ_RC[bit.bit_length() - 1], squares))
+                if epSq >= 0 and pawnAttacks[sq] & SQUARE_BB[epSq]:
+                    if self.enpassantIsLegal(sq, epSq, kingSq, us, them):
+                        moves.append(Move(SQ_RC[sq], SQ_RC[epSq], squares, isEnpassantMove=True))
+
+            ## knights (a pinned knight can never move)
+            knights = bbs[us + "N"]
+            while knights:
+                lsb = knights & -knights
+                knights ^= lsb
+                sq = lsb.bit_length() - 1
+                if sq in pins:
+                    continue
+                self.addMoves(sq, KNIGHT_ATTACKS[sq] & ~ours & targetMask & quietMask, moves)
+
+            ## sliders
+            for piece, attacks in ((us + "B", bishopAttacks), (us + "R", rookAttacks), (us + "Q", None)):
+                sliders = bbs[piece]
+                while sliders:
+                    lsb = sliders & -sliders
+                    sliders ^= lsb
+                    sq = lsb.bit_length() - 1
+                    if attacks is None:
+                        targets = rookAttacks(sq, occupied) | bishopAttacks(sq, occupied)
+                    else:
+                        targets = attacks(sq, occupied)
+                    self.addMoves(sq, targets & ~ours & targetMask & quietMask & pins.get(sq, FULL), moves)
+
+        ## king
+        withoutKing = occupied ^ SQUARE_BB[kingSq]
+        targets = KING_ATTACKS[kingSq] & ~ours & quietMask
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            sq = bit.bit_length() - 1
+            if not self.attackersTo(sq, them, withoutKing):
+                moves.append(Move(SQ_RC[kingSq], SQ_RC[sq], squares))
+        if not checkers and not self.capturesOnly:
+            self.getBitboardCastleMoves(kingSq, us, them, moves)
+        return moves, checkers != 0
+
+    def addMoves(self, sq, targets, moves):
+        start = SQ_RC[sq]
+        while targets:
+            bit = targets & -targets
+            targets ^= bit
+            moves.append(ChessEngine.Move(start, SQ_RC[bit.bit_length() - 1], self.squares))
+
+    def enpassantIsLegal(self, sq, epSq, kingSq, us, them):
+        ## both pawns leave their squares at once, so test the resulting occupancy directly
+        capturedSq = epSq + (8 if us == "w" else -8)
+        capturedBit = SQUARE_BB[capturedSq]
+        occupied = (self.occupied ^ SQUARE_BB[sq] ^ capturedBit) | SQUARE_BB[epSq]
+        bbs = self.pieceBitboards
+        queens = bbs[them + "Q"]
+        return not ((KNIGHT_ATTACKS[kingSq] & bbs[them + "N"])
+                    or (PAWN_ATTACKS[us][kingSq] & bbs[them + "p"] & ~capturedBit)
+                    or (rookAttacks(kingSq, occupied) & (bbs[them + "R"] | queens))
+                    or (bishopAttacks(kingSq, occupied) & (bbs[them + "B"] | queens)))
+
+    def getBitboardCastleMoves(self, kingSq, us, them, moves):
+        rights = self.castlingRights if us == "w" else self.castlingRights >> 2 # black's bits shifted onto white's
+        kingSide = rights & ChessEngine.CASTLE_WHITE_KINGSIDE
+        queenSide = rights & ChessEngine.CASTLE_WHITE_QUEENSIDE
+        occupied = self.occupied
+        if kingSide and not occupied & (SQUARE_BB[kingSq + 1] | SQUARE_BB[kingSq + 2]):
+            if not self.attackersTo(kingSq + 1, them, occupied) and not self.attackersTo(kingSq + 2, them, occupied):
+                moves.append(ChessEngine.Move(SQ_RC[kingSq], SQ_RC[kingSq + 2], self.squares, isCastleMove=True))
+        if queenSide and not occupied & (SQUARE_BB[kingSq - 1] | SQUARE_BB[kingSq - 2] | SQUARE_BB[kingSq - 3]):
+            if not self.attackersTo(kingSq - 1, them, occupied) and not self.attackersTo(kingSq - 2, them, occupied):
+                moves.append(ChessEngine.Move(SQ_RC[kingSq], SQ_RC[kingSq - 2], self.squares, isCastleMove=True))
@@ -0,0 +1,151 @@
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+import ChessBitboard
+import ChessPGN
+from ChessEngine import MOVE_PROMOTION_SHIFT, PIECE_LETTERS
+
+## Opening book: 16-byte entries laid out like Polyglot's (key, move, weight, learn, big-endian) and sorted
+## by key. The keys are ChessEngine's Zobrist keys rather than Polyglot's, so books are built from PGN with
+## this tool. The file is mmap-ed read-only and binary-searched in place: processes that open the same book
+## share its pages through the OS page cache instead of each loading a copy.
+ENTRY = struct.Struct(">QHHI")
+BOOK_PLIES = 20 # plies of every game that go into a built book
+MAX_WEIGHT = 0xFFFF
+RESULT_POINTS = {"1-0": (2, 0), "0-1": (0, 2), "1/2-1/2": (1, 1), "*": (1, 1)} # (white, black) weight of a game
+
+def encodeMove(move):
+    ## 12 bits start * 64 + end, 3 bits promotion piece type
+    return move.moveID | (move.packed >> MOVE_PROMOTION_SHIFT & 7) << 12
+
+
+class OpeningBook:
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.entries = size // ENTRY.size
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def lookup(self, key):
+        ## [(move code, weight)] stored for a position key
+        low, high = 0, self.entries
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self.data, middle * ENTRY.size)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        found = []
+        while low < self.entries:
+            entryKey, code, weight, learn = ENTRY.unpack_from(self.data, low * ENTRY.size)
+            if entryKey != key:
+                break
+            found.append((code, weight))
+            low += 1
+        return found
+
+    def bookMoves(self, gs, validMoves):
+        ## [(Move, weight)] of the book moves that are legal in gs
+        moves = []
+        for code, weight in self.lookup(gs.zobristKey):
+            for move in validMoves:
+                if move.moveID == code & 0xFFF:
+                    if move.isPawnPromotion:
+                        move = move.withPromotion(PIECE_LETTERS[code >> 12 & 7] if code >> 12 else "Q")
+                    moves.append((move, weight))
+                    break
+        return moves
+
+    def pickMove(self, gs, validMoves, rng=random):
+        ## a book move chosen with probability proportional to its weight, or None
+        moves = [(move, weight) for move, weight in self.bookMoves(gs, validMoves) if weight > 0]
+        if not moves:
+            return None
+        return rng.choices([move for move, weight in moves], weights=[weight for move, weight in moves])[0]
+
+
+def buildBook(games, plies=BOOK_PLIES, minGames=1):
+    ## sorted [(key, move code, weight)] from (headers, SAN moves, result) games. A move earns 2 for every
+    ## win of the side that played it and 1 for every draw; moves played in fewer than minGames games are left out.
+    stats = {}
+    for headers, sanMoves, result in games:
+        gs = ChessBitboard.BitboardGameState()
+        if "FEN" in headers:
+            try:
+                gs.loadFen(headers["FEN"])
+            except (ValueError, KeyError, IndexError):
+                continue
+        points = RESULT_POINTS.get(result, RESULT_POINTS["*"])
+        for san in sanMoves[:plies]:
+            move = gs.getMoveFromSan(san)
+            if move is None: # illegal or unreadable, the rest of the game is unusable
+                break
+            entry = stats.setdefault((gs.zobristKey, encodeMove(move)), [0, 0])
+            entry[0] += points[0 if gs.whiteToMove else 1]
+            entry[1] += 1
+            gs.makeMove(move)
+    entries = [(key, code, weight) for (key, code), (weight, count) in stats.items() if count >= minGames and weight > 0]
+    largest = max((weight for key, code, weight in entries), default=0)
+    if largest > MAX_WEIGHT: # scale down, keeping every move at weight 1 or more
+        entries = [(key, code, max(1, weight * MAX_WEIGHT // largest)) for key, code, weight in entries]
+    entries.sort()
+    return entries
+
+def writeBook(entries, path):
+    with open(path, "wb") as f:
+        for key, code, weight in entries:
+            f.write(ENTRY.pack(key, code, weight, 0))
+
+def iterateFiles(paths):
+    for path in paths:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield from f
+
+def runBuild(args):
+    games = ChessPGN.readGames(iterateFiles(args.pgn))
+    entries = buildBook(games, args.plies, args.min_games)
+    writeBook(entries, args.output)
+    print(f"{len(entries)} entries, {os.path.getsize(args.output)} bytes written to {args.output}")
+    return 0
+
+def runProbe(args):
+    book = OpeningBook(args.book)
+    gs = ChessBitboard.BitboardGameState()
+    if args.fen:
+        gs.loadFen(args.fen)
+    validMoves = gs.getValidMove()
+    moves = sorted(book.bookMoves(gs, validMoves), key=lambda item: -item[1])
+    total = sum(weight for move, weight in moves)
+    for move, weight in moves:
+        print(f"{gs.getSanNotation(move, validMoves):8} {weight:6} {weight / total:7.1%}" if total else gs.getSanNotation(move))
+    if not moves:
+        print("position not in book")
+    book.close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build or probe an opening book")
+    commands = parser.add_subparsers(dest="command", required=True)
+    buildParser = commands.add_parser("build", help="build a book from PGN files")
+    buildParser.add_argument("pgn", nargs="+")
+    buildParser.add_argument("--output", required=True)
+    buildParser.add_argument("--plies", type=int, default=BOOK_PLIES, help="plies of each game to take")
+    buildParser.add_argument("--min-games", type=int, default=1, help="leave out moves played in fewer games")
+    probeParser = commands.add_parser("probe", help="list the book moves of a position")
+    probeParser.add_argument("book")
+    probeParser.add_argument("--fen", help="position to look up, the start position if left out")
+    args = parser.parse_args(argv)
+    return {"build": runBuild, "probe": runProbe}[args.command](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,161 +1,460 @@
-import copy
+import random
+from array import array
 
-import numpy as np
+import ChessEval
+
+## Zobrist keys. Fixed seed, so every process hashes a position to the same key.
+_zobristRandom = random.Random(20200101)
+ZOBRIST_PIECES = {piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                  for piece in ["wp", "wN", "wB", "wR", "wQ", "wK", "bp", "bN", "bB", "bR", "bQ", "bK"]}
+ZOBRIST_SIDE = _zobristRandom.getrandbits(64) # xored in when black is to move
+_zobristCastleKeys = [_zobristRandom.getrandbits(64) for _ in range(4)] # wK, wQ, bK, bQ
+ZOBRIST_CASTLE = [0] * 16 # indexed by GameState.castlingRights
+for _rights in range(16):
+    for _bit in range(4):
+        if _rights & (1 << _bit):
+            ZOBRIST_CASTLE[_rights] ^= _zobristCastleKeys[_bit]
+ZOBRIST_ENPASSANT = [_zobristRandom.getrandbits(64) for _ in range(8)] # by file of the en passant square
+
+## Compact board: one byte per square (index row * 8 + col), a colour bit or-ed with the piece type.
+## 0 is an empty square. The "wp"/"bK" strings of Move and ChessMain are looked up in PIECE_NAMES.
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6
+WHITE = 8
+BLACK = 16
+PIECE_TYPE = 7 # code & PIECE_TYPE is the piece type
+PIECE_COLOR = WHITE | BLACK # code & PIECE_COLOR is the colour, 0 on an empty square
+PIECE_CODES = {"--": EMPTY}
+for _colorName, _color in (("w", WHITE), ("b", BLACK)):
+    for _pieceType, _letter in enumerate("pNBRQK", 1):
+        PIECE_CODES[_colorName + _letter] = _color | _pieceType
+PIECE_NAMES = ["--"] * 24
+for _name, _code in PIECE_CODES.items():
+    PIECE_NAMES[_code] = _name
+START_BOARD = [
+    ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
+    ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["--", "--", "--", "--", "--", "--", "--", "--"],
+    ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
+    ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
+]
+
+PIECE_LETTERS = " pNBRQK" # by piece type
+## Zobrist keys and piece-square scores by piece code; empty squares get all zeros
+ZOBRIST_BY_CODE = [ZOBRIST_PIECES.get(_name, [0] * 64) for _name in PIECE_NAMES]
+SQUARE_SCORES_BY_CODE = [ChessEval.PIECE_SQUARE_SCORES[_name] for _name in PIECE_NAMES]
+
+## Move.packed fields
+MOVE_ID_MASK = 0xFFF # start and end square
+MOVE_PROMOTION_SHIFT = 22
+MOVE_PROMOTION_MASK = 7 << MOVE_PROMOTION_SHIFT
+MOVE_ENPASSANT = 1 << 25
+MOVE_CASTLE = 1 << 26
+MOVE_IDENTITY = MOVE_ID_MASK | MOVE_PROMOTION_MASK # what == and hash() look at
+PROMOTION_TYPES = {"Q": QUEEN, "R": ROOK, "B": BISHOP, "N": KNIGHT}
+SQ_RC = [(sq >> 3, sq & 7) for sq in range(64)] # (row, col) of every square, shared instead of built per move
+
+## Castling rights: 4 bits, the same order as the Zobrist castle keys
+CASTLE_WHITE_KINGSIDE = 1
+CASTLE_WHITE_QUEENSIDE = 2
+CASTLE_BLACK_KINGSIDE = 4
+CASTLE_BLACK_QUEENSIDE = 8
+CASTLE_ALL = 15
+## rights kept by a move from or to a square: a king or rook leaving home, or a rook captured there
+CASTLE_RIGHTS_KEPT = [CASTLE_ALL] * 64
+CASTLE_RIGHTS_KEPT[60] = CASTLE_ALL ^ (CASTLE_WHITE_KINGSIDE | CASTLE_WHITE_QUEENSIDE) # e1
+CASTLE_RIGHTS_KEPT[63] = CASTLE_ALL ^ CASTLE_WHITE_KINGSIDE # h1
+CASTLE_RIGHTS_KEPT[56] = CASTLE_ALL ^ CASTLE_WHITE_QUEENSIDE # a1
+CASTLE_RIGHTS_KEPT[4] = CASTLE_ALL ^ (CASTLE_BLACK_KINGSIDE | CASTLE_BLACK_QUEENSIDE) # e8
+CASTLE_RIGHTS_KEPT[7] = CASTLE_ALL ^ CASTLE_BLACK_KINGSIDE # h8
+CASTLE_RIGHTS_KEPT[0] = CASTLE_ALL ^ CASTLE_BLACK_QUEENSIDE # a8
+CASTLE_HOME_SQUARES = [(60, WHITE | KING), (63, WHITE | ROOK), (56, WHITE | ROOK),
+                       (4, BLACK | KING), (7, BLACK | ROOK), (0, BLACK | ROOK)] # a right needs its king and rook here
+
+## Undo stack: one record per ply in two preallocated arrays, the hash before the move and a state word of
+## captured piece code | castling rights << 5 | (en passant square + 1, 0 for none) << 9 | halfmove clock << 16
+UNDO_STACK_SIZE = 128 # plies, doubled when a game or search goes deeper
+UNDO_CASTLE_SHIFT = 5
+UNDO_ENPASSANT_SHIFT = 9
+UNDO_HALFMOVE_SHIFT = 16
+
+## FEN piece letters
+fenPieces = {"P": "wp", "N": "wN", "B": "wB", "R": "wR", "Q": "wQ", "K": "wK",
+             "p": "bp", "n": "bN", "b": "bB", "r": "bR", "q": "bQ", "k": "bK"}
 ##
 class GameState:
 
     def __init__(self):
-        # board is a 8x8 matrix
-        self.board = np.array([
-            ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
-            ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["--", "--", "--", "--", "--", "--", "--", "--"],
-            ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
-            ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]
-        ])
-        self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
-                              'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
+        # squares is the 8x8 board flattened to 64 piece codes
+        self.squares = bytearray(PIECE_CODES[piece] for row in START_BOARD for piece in row)
+        self.moveFunctions = {PAWN: self.getPawnMoves, ROOK: self.getRookMoves, KNIGHT: self.getKnightMoves,
+                              BISHOP: self.getBishopMoves, QUEEN: self.getQueenMoves, KING: self.getKingMoves}
         self.whiteToMove = True
         self.whiteKingLocation = (7,4)
         self.blackKingLocation = (0,4)
         self.checkMate = False
         self.staleMate = False
         self.enpassantPossible = () # (row,column)
-        self.currentCastlingRight = CastleRights(True,True,True,True)
+        self.pins = {} # (row,column): pin direction, filled in by getValidMove
+        self.attackMap = None # cached getAttackMap() of the current position
+        self.capturesOnly = False # set by getValidCaptures while it generates
+        self.castlingRights = CASTLE_ALL # CASTLE_* bits
+        self.halfmoveClock = 0 # plies since the last capture or pawn move
+        self.startPly = 0 # plies played before moveLog starts, from the FEN fullmove number
+        self.moveLog = []
+        self.undoKeys = array("Q", [0]) * UNDO_STACK_SIZE # undo record of ply i, see UNDO_STACK_SIZE
+        self.undoStates = array("L", [0]) * UNDO_STACK_SIZE
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = ChessEval.scoreMaterial(self.board) # material + piece-square, kept up to date by makeMove/undoMove
+    @property
+    def board(self):
+        ## 8x8 piece strings ("wp", "--"), built on demand for drawing and notation
+        squares = self.squares
+        return [[PIECE_NAMES[code] for code in squares[r * 8:r * 8 + 8]] for r in range(8)]
+    def computeZobristKey(self):
+        key = 0
+        for sq in range(64):
+            piece = self.squares[sq]
+            if piece != EMPTY:
+                key ^= ZOBRIST_BY_CODE[piece][sq]
+        if not self.whiteToMove:
+            key ^= ZOBRIST_SIDE
+        key ^= ZOBRIST_CASTLE[self.castlingRights]
+        if self.enpassantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        return key
+    def loadFen(self, fen):
+        ## set up the position of a FEN string; missing trailing fields default to "w - - 0 1".
+        ## Raises ValueError, leaving the position as it was, when the FEN cannot be read or a side has no king or two.
+        ## Castling rights whose king or rook is not on its home square are dropped.
+        fields = fen.split()
+        rows = fields[0].split("/") if fields else []
+        if len(rows) != 8:
+            raise ValueError(f"FEN needs 8 ranks: {fen}")
+        squares = bytearray(64)
+        for r in range(8):
+            c = 0
+            for char in rows[r]:
+                if char.isdigit():
+                    if c + int(char) > 8:
+                        raise ValueError(f"bad FEN rank {rows[r]}: {fen}")
+                    c += int(char)
+                else:
+                    if char not in fenPieces or c > 7:
+                        raise ValueError(f"bad FEN rank {rows[r]}: {fen}")
+                    squares[r * 8 + c] = PIECE_CODES[fenPieces[char]]
+                    c += 1
+            if c != 8:
+                raise ValueError(f"bad FEN rank {rows[r]}: {fen}")
+        if squares.count(WHITE | KING) != 1 or squares.count(BLACK | KING) != 1:
+            raise ValueError(f"FEN needs one king of each colour: {fen}")
+        side = fields[1] if len(fields) > 1 else "w"
+        if side not in ("w", "b"):
+            raise ValueError(f"bad FEN side to move {side}: {fen}")
+        castling = fields[2] if len(fields) > 2 else "-"
+        if castling != "-" and (not castling or any(letter not in "KQkq" for letter in castling)):
+            raise ValueError(f"bad FEN castling rights {castling}: {fen}")
+        enpassant = fields[3] if len(fields) > 3 else "-"
+        if enpassant != "-" and (len(enpassant) != 2 or enpassant[0] not in Move.filesToCols or enpassant[1] not in "36"):
+            raise ValueError(f"bad FEN en passant square {enpassant}: {fen}")
+        try:
+            halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+            fullmove = int(fields[5]) if len(fields) > 5 else 1
+        except ValueError:
+            raise ValueError(f"bad FEN move counters: {fen}") from None
+        self.squares[:] = squares
+        self.whiteKingLocation = SQ_RC[squares.index(WHITE | KING)]
+        self.blackKingLocation = SQ_RC[squares.index(BLACK | KING)]
+        self.whiteToMove = side == "w"
+        self.castlingRights = (("K" in castling) * CASTLE_WHITE_KINGSIDE | ("Q" in castling) * CASTLE_WHITE_QUEENSIDE |
+                               ("k" in castling) * CASTLE_BLACK_KINGSIDE | ("q" in castling) * CASTLE_BLACK_QUEENSIDE)
+        for sq, piece in CASTLE_HOME_SQUARES: # rights whose king or rook has left home are dropped
+            if squares[sq] != piece:
+                self.castlingRights &= CASTLE_RIGHTS_KEPT[sq]
+        self.enpassantPossible = () if enpassant == "-" else SQ_RC[Move.ranksToRows[enpassant[1]] * 8 + Move.filesToCols[enpassant[0]]]
+        self.halfmoveClock = halfmoveClock
+        self.startPly = 2 * (fullmove - 1) + (not self.whiteToMove)
         self.moveLog = []
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.whiteKingSide,
-                                             self.currentCastlingRight.blackKingSide,
-                                             self.currentCastlingRight.whiteQueenSide,
-                                             self.currentCastlingRight.blackQueenSide)]
+        self.checkMate = False
+        self.staleMate = False
+        self.pins = {}
+        self.attackMap = None
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = ChessEval.scoreMaterial(self.board)
+    def toFen(self):
+        ## FEN string of the current position, the inverse of loadFen
+        rows = []
+        for r in range(8):
+            row = ""
+            empty = 0
+            for code in self.squares[r * 8:r * 8 + 8]:
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    row += str(empty)
+                    empty = 0
+                letter = PIECE_LETTERS[code & PIECE_TYPE]
+                row += letter.upper() if code & WHITE else letter.lower()
+            rows.append(row + (str(empty) if empty else ""))
+        castling = "".join(letter for bit, letter in ((CASTLE_WHITE_KINGSIDE, "K"), (CASTLE_WHITE_QUEENSIDE, "Q"),
+                                                      (CASTLE_BLACK_KINGSIDE, "k"), (CASTLE_BLACK_QUEENSIDE, "q"))
+                           if self.castlingRights & bit)
+        enpassant = Move.colsToFiles[self.enpassantPossible[1]] + Move.rowsToRanks[self.enpassantPossible[0]] \
+            if self.enpassantPossible else "-"
+        ply = self.startPly + len(self.moveLog)
+        return f"{'/'.join(rows)} {'w' if self.whiteToMove else 'b'} {castling or '-'} {enpassant} {self.halfmoveClock} {ply // 2 + 1}"
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--"
-        self.board[move.endRow][move.endCol] = move.pieceMoved
+        self.attackMap = None
+        squares = self.squares
+        packed = move.packed
+        start = packed >> 6 & 63
+        end = packed & 63
+        pieceMoved = packed >> 12 & 31
+        pieceCaptured = packed >> 17 & 31
+        ## undo record of this ply: everything the move throws away
+        ply = len(self.moveLog)
+        if ply == len(self.undoKeys):
+            self.growUndoStack()
+        previousEnpassant = self.enpassantPossible
+        previousRights = self.castlingRights
+        self.undoKeys[ply] = self.zobristKey
+        self.undoStates[ply] = (pieceCaptured | previousRights << UNDO_CASTLE_SHIFT | self.halfmoveClock << UNDO_HALFMOVE_SHIFT |
+                                (previousEnpassant[0] * 8 + previousEnpassant[1] + 1 if previousEnpassant else 0) << UNDO_ENPASSANT_SHIFT)
+        squares[start] = EMPTY
+        squares[end] = pieceMoved
         self.moveLog.append(move)
         self.whiteToMove = not self.whiteToMove
-        if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        if move.pieceMoved == 'bK':
-            self.blackKingLocation = (move.endRow, move.endCol)
-        if move.isPawnPromotion:  # Pawn Promotion
-            self.board[move.endRow][move.endCol] = move.pieceMoved[0] + move.promotionChoice
-        if move.isEnpassantMove: # En passant
-            self.board[move.startRow][move.endCol] = '--' # Capture
+        if pieceMoved == WHITE | KING:
+            self.whiteKingLocation = SQ_RC[end]
+        if pieceMoved == BLACK | KING:
+            self.blackKingLocation = SQ_RC[end]
+        if packed & MOVE_PROMOTION_MASK:  # Pawn Promotion
+            squares[end] = pieceMoved & PIECE_COLOR | packed >> MOVE_PROMOTION_SHIFT & 7
+        if packed & MOVE_ENPASSANT: # En passant
+            squares[start & 56 | end & 7] = EMPTY # Capture
         ## update enpassantPossible = ()
-        if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
-            self.enpassantPossible = ((move.startRow + move.endRow) // 2, move.startCol)
+        if pieceMoved & PIECE_TYPE == PAWN and abs(start - end) == 16:
+            self.enpassantPossible = SQ_RC[(start + end) >> 1]
 
         else:
             self.enpassantPossible = ()
-
+        if pieceMoved & PIECE_TYPE == PAWN or pieceCaptured:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
         ## castle move:
-        if move.isCastleMove:
-            if move.endCol - move.startCol == 2: # kingSide
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1]
-                self.board[move.endRow][move.endCol+1] = "--"
+        if packed & MOVE_CASTLE:
+            if end - start == 2: # kingSide
+                squares[end - 1] = squares[end + 1]
+                squares[end + 1] = EMPTY
             else: # queenSide
-                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2]
-                self.board[move.endRow][move.endCol-2] = "--"
+                squares[end + 1] = squares[end - 2]
+                squares[end - 2] = EMPTY
 
         ## update castling rights
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.whiteKingSide,
-                                             self.currentCastlingRight.blackKingSide,
-                                             self.currentCastlingRight.whiteQueenSide,
-                                             self.currentCastlingRight.blackQueenSide))
+        self.castlingRights = previousRights & CASTLE_RIGHTS_KEPT[start] & CASTLE_RIGHTS_KEPT[end]
+        self.updateZobristKey(move, previousEnpassant, previousRights)
+        self.boardScore += self.moveScoreDelta(move)
+    def growUndoStack(self):
+        self.undoKeys.extend(array("Q", [0]) * len(self.undoKeys))
+        self.undoStates.extend(array("L", [0]) * len(self.undoStates))
+    def moveScoreDelta(self, move):
+        ## change of ChessEval.scoreMaterial caused by the move, so leaves never rescan the board
+        scores = SQUARE_SCORES_BY_CODE
+        packed = move.packed
+        start = packed >> 6 & 63
+        end = packed & 63
+        pieceMoved = packed >> 12 & 31
+        pieceCaptured = packed >> 17 & 31
+        placedPiece = pieceMoved & PIECE_COLOR | packed >> MOVE_PROMOTION_SHIFT & 7 if packed & MOVE_PROMOTION_MASK else pieceMoved
+        delta = scores[placedPiece][end] - scores[pieceMoved][start]
+        if packed & MOVE_ENPASSANT:
+            delta -= scores[pieceCaptured][start & 56 | end & 7]
+        else:
+            delta -= scores[pieceCaptured][end]
+        if packed & MOVE_CASTLE:
+            rook = scores[pieceMoved & PIECE_COLOR | ROOK]
+            if end - start == 2: # kingSide
+                delta += rook[end - 1] - rook[end + 1]
+            else: # queenSide
+                delta += rook[end + 1] - rook[end - 2]
+        return delta
+    def updateZobristKey(self, move, previousEnpassant, previousRights):
+        ## xor out what the move changed instead of rehashing the board
+        zobrist = ZOBRIST_BY_CODE
+        key = self.zobristKey ^ ZOBRIST_SIDE
+        packed = move.packed
+        start = packed >> 6 & 63
+        end = packed & 63
+        pieceMoved = packed >> 12 & 31
+        pieceCaptured = packed >> 17 & 31
+        key ^= zobrist[pieceMoved][start] ^ zobrist[self.squares[end]][end]
+        if packed & MOVE_ENPASSANT:
+            key ^= zobrist[pieceCaptured][start & 56 | end & 7]
+        else:
+            key ^= zobrist[pieceCaptured][end] # all zeros for an empty square
+        if packed & MOVE_CASTLE:
+            rook = zobrist[pieceMoved & PIECE_COLOR | ROOK]
+            if end - start == 2: # kingSide
+                key ^= rook[end + 1] ^ rook[end - 1]
+            else: # queenSide
+                key ^= rook[end - 2] ^ rook[end + 1]
+        key ^= ZOBRIST_CASTLE[previousRights] ^ ZOBRIST_CASTLE[self.castlingRights]
+        if previousEnpassant:
+            key ^= ZOBRIST_ENPASSANT[previousEnpassant[1]]
+        if self.enpassantPossible:
+            key ^= ZOBRIST_ENPASSANT[self.enpassantPossible[1]]
+        self.zobristKey = key
     def undoMove(self):
         if len(self.moveLog) != 0:
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            state = self.undoStates[len(self.moveLog)]
+            self.attackMap = None
+            self.zobristKey = self.undoKeys[len(self.moveLog)]
+            self.boardScore -= self.moveScoreDelta(move)
+            squares = self.squares
+            packed = move.packed
+            start = packed >> 6 & 63
+            end = packed & 63
+            pieceMoved = packed >> 12 & 31
+            pieceCaptured = state & 31
+            squares[start] = pieceMoved
+            squares[end] = pieceCaptured
             self.whiteToMove = not self.whiteToMove
-            if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == 'bK':
-                self.blackKingLocation = (move.startRow, move.startCol)
-
-            ## undo two square pawn move
-            if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2:
-                self.enpassantPossible = ()
-            ## undo en passant
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.endCol] = "--"
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-                self.enpassantPossible = (move.endRow, move.endCol)
-            else: # check last move
-                if self.moveLog:
-                    lastMove = self.moveLog[-1]
-                    if lastMove.pieceMoved[1] == "p" and abs(lastMove.startRow - lastMove.endRow) == 2:
-                        self.enpassantPossible = ((lastMove.startRow + lastMove.endRow) // 2, lastMove.startCol)
+            if pieceMoved == WHITE | KING:
+                self.whiteKingLocation = SQ_RC[start]
+            elif pieceMoved == BLACK | KING:
+                self.blackKingLocation = SQ_RC[start]
 
+            ## undo en passant
+            if packed & MOVE_ENPASSANT:
+                squares[end] = EMPTY
+                squares[start & 56 | end & 7] = pieceCaptured
+            enpassant = state >> UNDO_ENPASSANT_SHIFT & 127
+            self.enpassantPossible = SQ_RC[enpassant - 1] if enpassant else ()
+            self.halfmoveClock = state >> UNDO_HALFMOVE_SHIFT
 
             ## undo castling rights
-            self.castleRightsLog.pop()
-            castleRights = copy.deepcopy(self.castleRightsLog[-1])
-            self.currentCastlingRight = castleRights
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2: # kingSide
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol-1]
-                    self.board[move.endRow][move.endCol - 1] = "--"
+            self.castlingRights = state >> UNDO_CASTLE_SHIFT & 15
+            if packed & MOVE_CASTLE:
+                if end - start == 2: # kingSide
+                    squares[end + 1] = squares[end - 1]
+                    squares[end - 1] = EMPTY
                 else: # queenSide
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol+1]
-                    self.board[move.endRow][move.endCol+1] = "--"
+                    squares[end - 2] = squares[end + 1]
+                    squares[end + 1] = EMPTY
             self.checkMate = False
             self.staleMate = False
 
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.whiteQueenSide = False
-            self.currentCastlingRight.whiteKingSide = False
-        elif move.pieceMoved == "bK":
-            self.currentCastlingRight.blackQueenSide = False
-            self.currentCastlingRight.blackKingSide = False
-        elif move.pieceMoved == "wR":
-            if move.startRow == 7:
-                if move.startCol == 0: # left rook
-                    self.currentCastlingRight.whiteQueenSide = False
-                elif move.startCol == 7: # right rook
-                    self.currentCastlingRight.whiteKingSide = False
-        elif move.pieceMoved == "bR":
-            if move.startRow == 0:
-                if move.startCol == 0: # left rook
-                    self.currentCastlingRight.blackQueenSide = False
-                elif move.startCol == 7: # right rook
-                    self.currentCastlingRight.blackKingSide = False
-        if move.pieceCaptured == "wR":
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.whiteQueenSide = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.whiteKingSide = False
-        elif move.pieceCaptured == "bR":
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRight.blackQueenSide = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.blackKingSide = False
-    def getValidMove(self):
-        tempEnpassantPossible = self.enpassantPossible
-        castleRights = CastleRights(self.currentCastlingRight.whiteKingSide,
-                                             self.currentCastlingRight.blackKingSide,
-                                             self.currentCastlingRight.whiteQueenSide,
-                                             self.currentCastlingRight.blackQueenSide)
-        moves = self.getAllPossibleMoves()
-        if self.whiteToMove:
-            self.getCastleMoves(self.whiteKingLocation[0],self.whiteKingLocation[1],moves)
+    def repetitions(self):
+        ## times the current position occurred before in the game. Only the positions since the last capture
+        ## or pawn move can be the same, and only every other one has the same side to move, so the hashes of
+        ## those plies on the undo stack are all that is compared, walking back from four plies ago.
+        ply = len(self.moveLog)
+        key = self.zobristKey
+        undoKeys = self.undoKeys
+        count = 0
+        for i in range(ply - 4, ply - min(self.halfmoveClock, ply) - 1, -2):
+            if undoKeys[i] == key:
+                count += 1
+        return count
+    def isRepetition(self):
+        ## the position occurred before, which the search scores as a draw; stops at the first match
+        if self.halfmoveClock < 4:
+            return False
+        ply = len(self.moveLog)
+        key = self.zobristKey
+        undoKeys = self.undoKeys
+        for i in range(ply - 4, ply - min(self.halfmoveClock, ply) - 1, -2):
+            if undoKeys[i] == key:
+                return True
+        return False
+    def drawReason(self):
+        ## "stalemate", "fifty-move rule" or "threefold repetition" when the game is drawn, else None.
+        ## Reads checkMate/staleMate, so call it after getValidMove; a mate on the last of the fifty moves wins.
+        if self.staleMate:
+            return "stalemate"
+        if self.checkMate:
+            return None
+        if self.halfmoveClock >= 100:
+            return "fifty-move rule"
+        if self.halfmoveClock >= 8 and self.repetitions() >= 2:
+            return "threefold repetition"
+        return None
+
+    def getSanNotation(self, move, validMoves=None):
+        ## standard algebraic notation of a legal move of the current position ("Nbd2", "exd5", "e8=Q+", "O-O#")
+        if validMoves is None:
+            validMoves = self.getValidMove()
+        packed = move.packed
+        pieceType = packed >> 12 & PIECE_TYPE
+        end = packed & 63
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        capture = "x" if packed >> 17 & 31 else ""
+        if packed & MOVE_CASTLE:
+            san = "O-O" if move.endCol == 6 else "O-O-O"
+        elif pieceType == PAWN:
+            san = (move.colsToFiles[move.startCol] + capture if capture else "") + endSquare
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
         else:
-            self.getCastleMoves(self.blackKingLocation[0],self.blackKingLocation[1],moves)
-        for i in range(len(moves)-1, -1, -1): #whenever removing, do it backwards
-            self.makeMove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            if self.inCheck():
-                moves.remove(moves[i])
-            self.whiteToMove = not self.whiteToMove
-            self.undoMove()
+            ## name the start file, rank or square when another piece of the type can reach the same square
+            others = [other for other in validMoves if other.packed & 63 == end and other.packed >> 12 & 31 == packed >> 12 & 31
+                      and other.moveID != move.moveID]
+            if not others:
+                fromSquare = ""
+            elif all(other.startCol != move.startCol for other in others):
+                fromSquare = move.colsToFiles[move.startCol]
+            elif all(other.startRow != move.startRow for other in others):
+                fromSquare = move.rowsToRanks[move.startRow]
+            else:
+                fromSquare = move.getRankFile(move.startRow, move.startCol)
+            san = PIECE_LETTERS[pieceType] + fromSquare + capture + endSquare
+        self.makeMove(move)
+        replies = self.getValidMove()
+        if self.inCheck():
+            san += "#" if len(replies) == 0 else "+"
+        self.undoMove()
+        return san
+    def getMoveFromSan(self, san, validMoves=None):
+        ## the legal move written san ("Nbd2", "exd5", "e8=Q+", "O-O"), or None
+        if validMoves is None:
+            validMoves = self.getValidMove()
+        san = san.rstrip("+#!?")
+        if san in ("O-O", "0-0", "O-O-O", "0-0-0"):
+            for move in validMoves:
+                if move.isCastleMove and (move.endCol == 6) == (len(san) == 3):
+                    return move
+            return None
+        promotion = None
+        if "=" in san:
+            san, promotion = san.split("=")
+        elif san and san[-1] in "QRBN" and san[0].islower(): # e8Q
+            san, promotion = san[:-1], san[-1]
+        san = san.replace("x", "").replace("-", "")
+        if len(san) < 2 or san[-2] not in Move.filesToCols or san[-1] not in Move.ranksToRows:
+            return None
+        end = Move.ranksToRows[san[-1]] * 8 + Move.filesToCols[san[-2]]
+        pieceType = PIECE_LETTERS.index(san[0]) if san[0] in "NBRQK" else PAWN
+        fromSquare = san[1:-2] if pieceType != PAWN else san[:-2]
+        for move in validMoves:
+            if move.packed & 63 != end or move.packed >> 12 & PIECE_TYPE != pieceType:
+                continue
+            if any(move.colsToFiles[move.startCol] != char if char in Move.filesToCols else
+                   move.rowsToRanks[move.startRow] != char for char in fromSquare):
+                continue
+            if move.isPawnPromotion:
+                return move.withPromotion(promotion.upper()) if promotion and promotion.upper() in PROMOTION_TYPES else None
+            return move
+        return None
+    def getValidMove(self):
+        moves, inCheck = self.getLegalMoves()
         if len(moves) == 0:
-            if self.inCheck():
+            if inCheck:
                 self.checkMate = True
 
             else:
@@ -164,10 +463,45 @@ class GameState:
         else:
             self.checkMate = False
             self.staleMate = False
-        self.enpassantPossible = tempEnpassantPossible
-        self.currentCastlingRight = castleRights
         return moves
 
+    def getValidCaptures(self):
+        ## legal captures and promotions only, for quiescence search; quiet moves are never built.
+        ## checkMate/staleMate are left alone, an empty list here says nothing about them.
+        self.capturesOnly = True
+        moves = self.getLegalMoves()[0]
+        self.capturesOnly = False
+        return moves
+
+    def getLegalMoves(self):
+        if self.whiteToMove:
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            kingRow, kingCol = self.blackKingLocation
+        ## checks and pins are found once per position, so every generated move is already legal
+        inCheck, self.pins, checks = self.checkForPinsAndChecks(kingRow, kingCol)
+        if inCheck:
+            if len(checks) == 1: # block the check, capture the checker or move the king
+                moves = self.getAllPossibleMoves()
+                checkRow, checkCol, dirRow, dirCol = checks[0]
+                validSquares = {checkRow * 8 + checkCol}
+                if self.squares[checkRow * 8 + checkCol] & PIECE_TYPE != KNIGHT:
+                    for i in range(1, 8):
+                        square = (kingRow + dirRow * i) * 8 + kingCol + dirCol * i
+                        validSquares.add(square)
+                        if square == checkRow * 8 + checkCol:
+                            break
+                moves = [move for move in moves if move.packed >> 12 & PIECE_TYPE == KING
+                         or move.packed & MOVE_ENPASSANT or move.packed & 63 in validSquares]
+            else: # double check: only the king can move
+                moves = []
+                self.getKingMoves(kingRow, kingCol, moves)
+        else:
+            moves = self.getAllPossibleMoves()
+            if not self.capturesOnly:
+                self.getCastleMoves(kingRow, kingCol, moves)
+        return moves, inCheck
+
 
     def inCheck(self):
         if self.whiteToMove:
@@ -176,94 +510,254 @@ class GameState:
             return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1])
 
     def squareUnderAttack(self, r, c):
-        self.whiteToMove = not self.whiteToMove
-        oppMoves = self.getAllPossibleMoves()
-        self.whiteToMove = not self.whiteToMove
-        for move in oppMoves:
-            if move.endRow == r and move.endCol == c:
-                return True
+        ## looks outward from (r, c) along rays, knight jumps, pawn diagonals and king steps
+        ## for an enemy piece that attacks it. Our own king does not block, like in checkForPinsAndChecks.
+        if self.attackMap is not None:
+            return self.attackMap[r][c]
+        enemyColor = BLACK if self.whiteToMove else WHITE
+        allyKing = WHITE | KING if self.whiteToMove else BLACK | KING
+        squares = self.squares
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(8):
+            d = directions[j]
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = squares[endRow * 8 + endCol]
+                    if endPiece == EMPTY or endPiece == allyKing:
+                        continue
+                    if endPiece & PIECE_COLOR == enemyColor:
+                        pieceType = endPiece & PIECE_TYPE
+                        if (j <= 3 and pieceType == ROOK) or (j >= 4 and pieceType == BISHOP) or pieceType == QUEEN or \
+                                (i == 1 and pieceType == PAWN and ((enemyColor == WHITE and j >= 6) or (enemyColor == BLACK and 4 <= j <= 5))) or \
+                                (i == 1 and pieceType == KING):
+                            return True
+                    break
+                else:
+                    break # outofrange
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                if squares[endRow * 8 + endCol] == enemyColor | KNIGHT:
+                    return True
         return False
+
+    def getAttackMap(self):
+        ## 8x8 grid of the squares the side not to move attacks. It is cached for the current
+        ## position (makeMove/undoMove throw it away) and answers squareUnderAttack while it lives.
+        if self.attackMap is None:
+            attackMap = [[False] * 8 for _ in range(8)]
+            enemyColor = BLACK if self.whiteToMove else WHITE
+            allyKing = WHITE | KING if self.whiteToMove else BLACK | KING
+            squares = self.squares
+            knightMoves = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2), (2, -1), (2, 1))
+            kingMoves = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+            rookDirections = ((-1, 0), (0, -1), (1, 0), (0, 1))
+            bishopDirections = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+            for r in range(8):
+                for c in range(8):
+                    piece = squares[r * 8 + c]
+                    if piece & PIECE_COLOR != enemyColor:
+                        continue
+                    pieceType = piece & PIECE_TYPE
+                    if pieceType == PAWN:
+                        steps = ((-1, -1), (-1, 1)) if enemyColor == WHITE else ((1, -1), (1, 1))
+                    elif pieceType == KNIGHT:
+                        steps = knightMoves
+                    elif pieceType == KING:
+                        steps = kingMoves
+                    else:
+                        steps = ()
+                        if pieceType == ROOK:
+                            directions = rookDirections
+                        elif pieceType == BISHOP:
+                            directions = bishopDirections
+                        else:
+                            directions = kingMoves
+                        for d in directions:
+                            for i in range(1, 8):
+                                endRow = r + d[0] * i
+                                endCol = c + d[1] * i
+                                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                                    attackMap[endRow][endCol] = True
+                                    endPiece = squares[endRow * 8 + endCol]
+                                    if endPiece != EMPTY and endPiece != allyKing:
+                                        break
+                                else:
+                                    break
+                    for m in steps:
+                        endRow = r + m[0]
+                        endCol = c + m[1]
+                        if 0 <= endRow < 8 and 0 <= endCol < 8:
+                            attackMap[endRow][endCol] = True
+            self.attackMap = attackMap
+        return self.attackMap
+
+    def checkForPinsAndChecks(self, r, c):
+        ## looks outward from (r, c) as if the side to move had its king there.
+        ## Our own king is see-through, so squares next to it along a checking ray stay attacked.
+        pins = {} # (row, col): direction from the king
+        checks = [] # (row, col, dirRow, dirCol)
+        inCheck = False
+        allyColor, enemyColor = (WHITE, BLACK) if self.whiteToMove else (BLACK, WHITE)
+        squares = self.squares
+        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+        for j in range(8):
+            d = directions[j]
+            possiblePin = ()
+            for i in range(1, 8):
+                endRow = r + d[0] * i
+                endCol = c + d[1] * i
+                if 0 <= endRow < 8 and 0 <= endCol < 8:
+                    endPiece = squares[endRow * 8 + endCol]
+                    if endPiece & PIECE_COLOR == allyColor and endPiece & PIECE_TYPE != KING:
+                        if possiblePin == ():
+                            possiblePin = (endRow, endCol)
+                        else: # second ally piece, no pin or check this way
+                            break
+                    elif endPiece & PIECE_COLOR == enemyColor:
+                        pieceType = endPiece & PIECE_TYPE
+                        ## orthogonal rook, diagonal bishop, adjacent pawn/king, any queen
+                        if (j <= 3 and pieceType == ROOK) or (j >= 4 and pieceType == BISHOP) or pieceType == QUEEN or \
+                                (i == 1 and pieceType == PAWN and ((enemyColor == WHITE and j >= 6) or (enemyColor == BLACK and 4 <= j <= 5))) or \
+                                (i == 1 and pieceType == KING):
+                            if possiblePin == ():
+                                inCheck = True
+                                checks.append((endRow, endCol, d[0], d[1]))
+                            else:
+                                pins[possiblePin] = d
+                        break
+                else:
+                    break # outofrange
+        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2), (2, -1), (2, 1))
+        for m in knightMoves:
+            endRow = r + m[0]
+            endCol = c + m[1]
+            if 0 <= endRow < 8 and 0 <= endCol < 8:
+                if squares[endRow * 8 + endCol] == enemyColor | KNIGHT:
+                    inCheck = True
+                    checks.append((endRow, endCol, m[0], m[1]))
+        return inCheck, pins, checks
+
+    def pinAllows(self, r, c, d):
+        pinDirection = self.pins.get((r, c))
+        return pinDirection is None or pinDirection == d or pinDirection == (-d[0], -d[1])
+
+    def enpassantIsLegal(self, r, c, endRow, endCol):
+        ## both pawns leave the rank at once, so test the king on the resulting board directly
+        squares = self.squares
+        movedPiece = squares[r * 8 + c]
+        capturedPiece = squares[r * 8 + endCol]
+        squares[r * 8 + c] = EMPTY
+        squares[r * 8 + endCol] = EMPTY
+        squares[endRow * 8 + endCol] = movedPiece
+        kingRow, kingCol = self.whiteKingLocation if self.whiteToMove else self.blackKingLocation
+        inCheck = self.checkForPinsAndChecks(kingRow, kingCol)[0]
+        squares[endRow * 8 + endCol] = EMPTY
+        squares[r * 8 + endCol] = capturedPiece
+        squares[r * 8 + c] = movedPiece
+        return not inCheck
     def getAllPossibleMoves(self):
         moves = []
-        for r in range(len(self.board)):
-            for c in range(len(self.board[r])):
-                turn = self.board[r][c][0]
-                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
-                    piece = self.board[r][c][1]
-                    self.moveFunctions[piece](r,c,moves)
+        allyColor = WHITE if self.whiteToMove else BLACK
+        squares = self.squares
+        for r in range(8):
+            for c in range(8):
+                piece = squares[r * 8 + c]
+                if piece & PIECE_COLOR == allyColor:
+                    self.moveFunctions[piece & PIECE_TYPE](r,c,moves)
         return moves
     def getPawnMoves(self, r, c, moves):
+        squares = self.squares
         if self.whiteToMove:
-            if self.board[r-1][c] == "--": # one square forward
-                moves.append(Move((r, c), (r-1, c), self.board))
-                if r == 6 and self.board[r-2][c] == "--": # two square forward
-                    moves.append(Move((r,c), (r-2,c),self.board))
+            if squares[(r-1)*8 + c] == EMPTY and self.pinAllows(r, c, (-1, 0)) and (r == 1 or not self.capturesOnly): # one square forward
+                moves.append(Move((r, c), (r-1, c), squares))
+                if r == 6 and squares[(r-2)*8 + c] == EMPTY: # two square forward
+                    moves.append(Move((r,c), (r-2,c),squares))
             if c-1 >= 0: # capture left
-                if self.board[r-1][c-1][0] == "b":
-                    moves.append(Move((r,c), (r-1,c-1), self.board))
-                elif (r-1,c-1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c-1), self.board, isEnpassantMove=True))
+                if squares[(r-1)*8 + c-1] & BLACK:
+                    if self.pinAllows(r, c, (-1, -1)):
+                        moves.append(Move((r,c), (r-1,c-1), squares))
+                elif (r-1,c-1) == self.enpassantPossible and self.enpassantIsLegal(r, c, r-1, c-1):
+                    moves.append(Move((r, c), (r-1, c-1), squares, isEnpassantMove=True))
             if c+1 <= 7: # capture right
-                if self.board[r - 1][c + 1][0] == "b":
-                    moves.append(Move((r,c),(r-1,c+1),self.board))
-                elif (r-1,c+1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r-1, c+1), self.board, isEnpassantMove=True))
+                if squares[(r-1)*8 + c+1] & BLACK:
+                    if self.pinAllows(r, c, (-1, 1)):
+                        moves.append(Move((r,c),(r-1,c+1),squares))
+                elif (r-1,c+1) == self.enpassantPossible and self.enpassantIsLegal(r, c, r-1, c+1):
+                    moves.append(Move((r, c), (r-1, c+1), squares, isEnpassantMove=True))
         else:
-            if self.board[r+1][c] == "--":  # one square forward
-                moves.append(Move((r, c), (r + 1, c), self.board))
-                if r == 1 and self.board[r + 2][c] == "--":  # two square forward
-                    moves.append(Move((r, c), (r + 2, c), self.board))
+            if squares[(r+1)*8 + c] == EMPTY and self.pinAllows(r, c, (1, 0)) and (r == 6 or not self.capturesOnly):  # one square forward
+                moves.append(Move((r, c), (r + 1, c), squares))
+                if r == 1 and squares[(r+2)*8 + c] == EMPTY:  # two square forward
+                    moves.append(Move((r, c), (r + 2, c), squares))
             if c - 1 >= 0:
-                if self.board[r + 1][c - 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board))
-                elif (r + 1, c - 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c - 1), self.board, isEnpassantMove=True))
+                if squares[(r+1)*8 + c-1] & WHITE:
+                    if self.pinAllows(r, c, (1, -1)):
+                        moves.append(Move((r, c), (r + 1, c - 1), squares))
+                elif (r + 1, c - 1) == self.enpassantPossible and self.enpassantIsLegal(r, c, r + 1, c - 1):
+                    moves.append(Move((r, c), (r + 1, c - 1), squares, isEnpassantMove=True))
             if c + 1 <= 7:
-                if self.board[r + 1][c + 1][0] == "w":
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board))
-                elif (r + 1, c + 1) == self.enpassantPossible:
-                    moves.append(Move((r, c), (r + 1, c + 1), self.board, isEnpassantMove=True))
+                if squares[(r+1)*8 + c+1] & WHITE:
+                    if self.pinAllows(r, c, (1, 1)):
+                        moves.append(Move((r, c), (r + 1, c + 1), squares))
+                elif (r + 1, c + 1) == self.enpassantPossible and self.enpassantIsLegal(r, c, r + 1, c + 1):
+                    moves.append(Move((r, c), (r + 1, c + 1), squares, isEnpassantMove=True))
     def getRookMoves(self, r, c, moves):
         directions = ((-1, 0),(0,-1),(1,0),(0,1))
-        enemyColor = 'b' if self.whiteToMove else 'w'
+        enemyColor = BLACK if self.whiteToMove else WHITE
+        squares = self.squares
         for d in directions:
+            if not self.pinAllows(r, c, d):
+                continue
             for i in range(1,8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == '--':
-                        moves.append(Move((r,c),(endRow,endCol), self.board))
-                    elif endPiece[0] == enemyColor:
-                        moves.append(Move((r,c),(endRow, endCol),self.board))
+                    endPiece = squares[endRow * 8 + endCol]
+                    if endPiece == EMPTY:
+                        if not self.capturesOnly:
+                            moves.append(Move((r,c),(endRow,endCol), squares))
+                    elif endPiece & PIECE_COLOR == enemyColor:
+                        moves.append(Move((r,c),(endRow, endCol),squares))
                         break
                     else: #friendly
                         break
                 else:
                     break #outofrange
     def getKnightMoves(self, r, c, moves):
+        if (r, c) in self.pins: # a pinned knight can never move
+            return
         knightMoves = ((-2, -1),(-2, 1),(-1, -2), (1, -2),(-1, 2), (1,2), (2,-1),(2,1))
-        allyColor = 'w' if self.whiteToMove else 'b'
+        allyColor = WHITE if self.whiteToMove else BLACK
+        squares = self.squares
         for m in knightMoves:
             endRow = r + m[0]
             endCol = c + m[1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:
-                    moves.append(Move((r,c),(endRow,endCol), self.board))
+                endPiece = squares[endRow * 8 + endCol]
+                if endPiece & PIECE_COLOR != allyColor and (endPiece != EMPTY or not self.capturesOnly):
+                    moves.append(Move((r,c),(endRow,endCol), squares))
     def getBishopMoves(self, r, c, moves):
         directions = ((-1, -1), (-1, 1), (1, -1), (1, 1))
-        enemyColor = 'b' if self.whiteToMove else 'w'
+        enemyColor = BLACK if self.whiteToMove else WHITE
+        squares = self.squares
         for d in directions:
+            if not self.pinAllows(r, c, d):
+                continue
             for i in range(1, 8):
                 endRow = r + d[0] * i
                 endCol = c + d[1] * i
                 if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece == '--':
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
-                    elif endPiece[0] == enemyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    endPiece = squares[endRow * 8 + endCol]
+                    if endPiece == EMPTY:
+                        if not self.capturesOnly:
+                            moves.append(Move((r, c), (endRow, endCol), squares))
+                    elif endPiece & PIECE_COLOR == enemyColor:
+                        moves.append(Move((r, c), (endRow, endCol), squares))
                         break
                     else:  # friendly
                         break
@@ -275,74 +769,111 @@ class GameState:
 
     def getKingMoves(self, r, c, moves):
         directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (1,1), (1,-1),(-1,-1),(-1,1))
-        allyColor = 'w' if self.whiteToMove else 'b'
+        allyColor = WHITE if self.whiteToMove else BLACK
+        squares = self.squares
         for i in range(8):
             endRow = r + directions[i][0]
             endCol = c + directions[i][1]
             if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor:
-                        moves.append(Move((r, c), (endRow, endCol), self.board))
+                    endPiece = squares[endRow * 8 + endCol]
+                    if endPiece & PIECE_COLOR != allyColor and (endPiece != EMPTY or not self.capturesOnly) \
+                            and not self.squareUnderAttack(endRow, endCol):
+                        moves.append(Move((r, c), (endRow, endCol), squares))
 
 
-    def getCastleMoves(self,r,c,moves):
-        if self.squareUnderAttack(r,c):
-            return
-        if (self.whiteToMove and self.currentCastlingRight.whiteKingSide) or (not self.whiteToMove and self.currentCastlingRight.blackKingSide):
+    def getCastleMoves(self,r,c,moves): # only called when not in check
+        rights = self.castlingRights if self.whiteToMove else self.castlingRights >> 2 # black's bits shifted onto white's
+        if rights & CASTLE_WHITE_KINGSIDE:
             self.getKingsideCastleMoves(r,c,moves)
-        if (self.whiteToMove and self.currentCastlingRight.whiteQueenSide) or (not self.whiteToMove and self.currentCastlingRight.blackQueenSide):
+        if rights & CASTLE_WHITE_QUEENSIDE:
             self.getQueensideCastleMoves(r,c, moves)
     def getKingsideCastleMoves(self,r,c,moves):
-        if self.board[r][c+1] == "--" and self.board[r][c+2] == "--":
+        if self.squares[r*8 + c+1] == EMPTY and self.squares[r*8 + c+2] == EMPTY:
             if not self.squareUnderAttack(r, c+1) and not self.squareUnderAttack(r, c + 2):
-                moves.append(Move((r,c),(r,c+2),self.board, isCastleMove = True))
+                moves.append(Move((r,c),(r,c+2),self.squares, isCastleMove = True))
 
     def getQueensideCastleMoves(self, r, c, moves):
-        if self.board[r][c - 1] == "--" and self.board[r][c - 2] == "--" and self.board[r][c - 3] == "--":
+        if self.squares[r*8 + c-1] == EMPTY and self.squares[r*8 + c-2] == EMPTY and self.squares[r*8 + c-3] == EMPTY:
             if not self.squareUnderAttack(r, c - 1) and not self.squareUnderAttack(r, c - 2):
-               moves.append(Move((r, c), (r, c - 2), self.board, isCastleMove = True))
-
-
-class CastleRights():
-    def __init__(self, whiteKingSide, blackKingSide, whiteQueenSide, blackQueenSide):
-        self.whiteKingSide = whiteKingSide
-        self.blackKingSide = blackKingSide
-        self.whiteQueenSide = whiteQueenSide
-        self.blackQueenSide = blackQueenSide
-    def __repr__(self):
-        return f"{self.whiteKingSide, self.blackKingSide, self.whiteQueenSide, self.blackQueenSide}"
+               moves.append(Move((r, c), (r, c - 2), self.squares, isCastleMove = True))
 
 
 class Move():
+    ## The whole move is one int, so generated moves are small and cheap to build:
+    ## bits 0-5 end square, 6-11 start square (square = row * 8 + col), 12-16 moved piece code,
+    ## 17-21 captured piece code, 22-24 promotion piece type, 25 en passant, 26 castle.
+    ## Everything else (rows, piece strings, notation) is decoded when it is asked for.
+    __slots__ = ("packed",)
     ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
     rowsToRanks = {v: k for k, v in ranksToRows.items()}
     filesToCols = {"a": 0, "b": 1, "c": 2, "d": 3, "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
-    def __init__(self, startSq, endSq, board, isEnpassantMove = False, isCastleMove = False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        ## Promotion
-        self.isPawnPromotion = ((self.pieceMoved == "wp" and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7))
-        self.promotionChoice = "Q" # "Q", "B", "R", or "N"
+    def __init__(self, startSq, endSq, squares, isEnpassantMove = False, isCastleMove = False):
+        start = startSq[0] * 8 + startSq[1]
+        end = endSq[0] * 8 + endSq[1]
+        pieceMoved = squares[start]
+        packed = start << 6 | end | pieceMoved << 12
         ## En passant
-        self.isEnpassantMove = isEnpassantMove
-        if self.isEnpassantMove:
-            self.pieceCaptured = "wp" if self.pieceMoved == "bp" else "bp"
+        if isEnpassantMove:
+            packed |= (pieceMoved ^ PIECE_COLOR) << 17 | MOVE_ENPASSANT # the pawn beside, not the empty end square
+        else:
+            packed |= squares[end] << 17
+        ## Promotion, to a queen unless withPromotion picks another piece
+        if pieceMoved & PIECE_TYPE == PAWN and (end < 8 or end >= 56):
+            packed |= QUEEN << MOVE_PROMOTION_SHIFT
         ##Castle
-        self.isCastleMove = isCastleMove
+        if isCastleMove:
+            packed |= MOVE_CASTLE
+        self.packed = packed
 
+    def withPromotion(self, choice):
+        ## the same pawn move promoting to choice ("Q", "R", "B" or "N")
+        move = object.__new__(Move)
+        move.packed = self.packed & ~MOVE_PROMOTION_MASK | PROMOTION_TYPES[choice] << MOVE_PROMOTION_SHIFT
+        return move
 
+    @property
+    def moveID(self): # start * 64 + end
+        return self.packed & MOVE_ID_MASK
+    @property
+    def startRow(self):
+        return self.packed >> 9 & 7
+    @property
+    def startCol(self):
+        return self.packed >> 6 & 7
+    @property
+    def endRow(self):
+        return self.packed >> 3 & 7
+    @property
+    def endCol(self):
+        return self.packed & 7
+    @property
+    def pieceMoved(self):
+        return PIECE_NAMES[self.packed >> 12 & 31]
+    @property
+    def pieceCaptured(self):
+        return PIECE_NAMES[self.packed >> 17 & 31]
+    @property
+    def isPawnPromotion(self):
+        return self.packed & MOVE_PROMOTION_MASK != 0
+    @property
+    def promotionChoice(self): # "Q", "R", "B" or "N"
+        return PIECE_LETTERS[self.packed >> MOVE_PROMOTION_SHIFT & 7] if self.isPawnPromotion else "Q"
+    @property
+    def isEnpassantMove(self):
+        return self.packed & MOVE_ENPASSANT != 0
+    @property
+    def isCastleMove(self):
+        return self.packed & MOVE_CASTLE != 0
 
     def __eq__(self, other):
+        ## same squares and promotion piece; moves built from mouse clicks carry no en passant flag
         if isinstance(other, Move):
-            if self.moveID == other.moveID:
+            if (self.packed ^ other.packed) & MOVE_IDENTITY == 0:
                 return True
         return False
+    def __hash__(self):
+        return self.packed & MOVE_IDENTITY
     def __repr__(self):
         startsqr = self.colsToFiles[self.startCol] + self.rowsToRanks[self.startRow]
         endsqr = self.colsToFiles[self.endCol] + self.rowsToRanks[self.endRow]
@@ -370,5 +901,7 @@ class Move():
         return returnText
     def getChessNotation(self):
         return self.getRankFile(self.startRow, self.startCol) + self.getRankFile(self.endRow, self.endCol)
+    def getUciNotation(self): # coordinate notation with the promotion piece, e.g. "e7e8q"
+        return self.getChessNotation() + (self.promotionChoice.lower() if self.isPawnPromotion else "")
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowsToRanks[row]
@@ -0,0 +1,137 @@
+## Material and piece-square tables, shared by ChessAI.scoreBoard and the incremental score
+## GameState keeps in makeMove/undoMove.
+pieceScore = {"K": 0, "Q": 24, "R": 12, "B": 8, "N": 8, "p": 2}
+
+KnightScore = [
+    [-4, -2, 0, -2, -2, 0, -2, -4],
+    [-2, 0, 0, 0, 0, 0, 0, -2],
+    [-2, 1, 0, 1, 1, 0, 0, -2],
+    [0, 1, 1, 2, 2, 1, 1, 0],
+    [0, 1, 1, 2, 2, 1, 1, 0],
+    [-2, 0, 0, 1, 1, 0, 0, -2],
+    [-2, 0, 0, 0, 0, 0, 0, -2],
+    [-4, -2, 0, -2, -2, 0, -2, -4]
+]
+RookScore = [
+[0,0,0,2,2,0,0,0],
+[1,1,1,1,1,1,1,1],
+[0,0,0,0,0,0,0,0],
+[0,0,0,0,0,0,0,0],
+[0,0,0,0,0,0,0,0],
+[0,0,0,0,0,0,0,0],
+[1,1,1,1,1,1,1,1],
+[0,0,0,2,2,0,0,0]
+    ]
+PawnScoreW = [
+[0,0,0,0,0,0,0,0],
+[6,6,6,6,6,6,6,6],
+[3,3,3,3,3,3,3,3],
+[0,0,0,3,3,0,0,0],
+[0,0,2,3,3,0,0,0],
+[1,0,0,0,0,0,0,1],
+[1,1,1,0,0,1,1,1],
+[0,0,0,0,0,0,0,0]
+    ]
+PawnScoreB = [
+[0,0,0,0,0,0,0,0],
+[1,1,1,0,0,1,1,1],
+[1,0,0,0,0,0,0,1],
+[0,0,2,3,3,0,0,0],
+[0,0,0,3,3,0,0,0],
+[3,3,3,3,3,3,3,3],
+[6,6,6,6,6,6,6,6],
+[0,0,0,0,0,0,0,0]
+    ]
+BishopScore = [
+    [-2, 0, 0, 0, 0, 0, 0, -2],
+    [0, 2, 0, 1, 1, 0, 2, 0],
+    [0, 1, 1, 1, 1, 1, 1, 0],
+    [0, 0, 3, 2, 2, 3, 0, 0],
+    [0, 0, 3, 2, 2, 3, 0, 0],
+    [0, 1, 1, 1, 1, 1, 1, 0],
+    [0, 2, 0, 1, 1, 0, 2, 0],
+    [-2, 0, 0, 0, 0, 0, 0, -2]
+]
+QueenScore = [
+[-4,0,0,0,0,0,0,-4],
+[-1,0,1,0,0,0,0,-1],
+[-1,1,0,0,0,0,0,-1],
+[1,0,0,0,0,0,0,0],
+[1,0,0,0,0,0,0,0],
+[-1,1,0,0,0,0,0,-1],
+[-1,0,1,0,0,0,0,-1],
+[-4,0,0,0,0,0,0,-4]
+    ]
+KingScoreW = [
+[-6,-6,-6,-6,-6,-6,-6,-6],
+[-5,-5,-5,-5,-5,-5,-5,-5],
+[-4,-4,-4,-4,-4,-4,-4,-4],
+[-3,-3,-3,-3,-3,-3,-3,-3],
+[-2,-2,-2,-2,-2,-2,-2,-2],
+[-1,-1,-1,-1,-1,-1,-1,-1],
+[1,0,-1,0,0,-1,0,1],
+[2,3,0,0,0,0,3,2]
+    ]
+KingScoreB = [
+[2,3,0,0,0,0,3,2],
+[1,0,-1,0,0,-1,0,1],
+[-1,-1,-1,-1,-1,-1,-1,-1],
+[-2,-2,-2,-2,-2,-2,-2,-2],
+[-3,-3,-3,-3,-3,-3,-3,-3],
+[-4,-4,-4,-4,-4,-4,-4,-4],
+[-5,-5,-5,-5,-5,-5,-5,-5],
+[-6,-6,-6,-6,-6,-6,-6,-6],
+    ]
+
+piecePositionScores = {"wN": KnightScore, "bN": KnightScore, "wK": KingScoreW, "bK": KingScoreB,
+                       "wB": BishopScore, "bB": BishopScore, "wR": RookScore, "bR": RookScore,
+                       "wp": PawnScoreW, "bp": PawnScoreB, "wQ": QueenScore, "bQ": QueenScore}
+
+## PIECE_SQUARE_SCORES[piece][row * 8 + col]: material + position of one piece, from white's side
+PIECE_SQUARE_SCORES = {"--": [0] * 64}
+for _piece, _table in piecePositionScores.items():
+    _sign = 1 if _piece[0] == "w" else -1
+    PIECE_SQUARE_SCORES[_piece] = [_sign * (pieceScore[_piece[1]] + _table[_sq // 8][_sq % 8]) for _sq in range(64)]
+
+
+def scoreMaterial(board):
+    ## full recompute over all 64 squares
+    score = 0
+    for row in range(len(board)):
+        for col in range(len(board[row])):
+            square = board[row][col]
+
+
+            if square != "--":
+                piecePositionScore = 0
+                if square[0] == "w":
+
+                    if square[1] == "N":
+                        piecePositionScore = KnightScore[row][col]
+                    elif square[1] == "K":
+                        piecePositionScore = KingScoreW[row][col]
+                    elif square[1] == "B":
+                        piecePositionScore = BishopScore[row][col]
+                    elif square[1] == "R":
+                        piecePositionScore = RookScore[row][col]
+                    elif square[1] == "p":
+                        piecePositionScore = PawnScoreW[row][col]
+                    elif square[1] == "Q":
+                        piecePositionScore = QueenScore[row][col]
+                    score += (pieceScore[square[1]] + piecePositionScore)
+                elif square[0] == "b":
+                    if square[1] == "N":
+                        piecePositionScore = KnightScore[row][col]
+                    elif square[1] == "K":
+                        piecePositionScore = KingScoreB[row][col]
+                    elif square[1] == "B":
+                        piecePositionScore = BishopScore[row][col]
+                    elif square[1] == "R":
+                        piecePositionScore = RookScore[row][col]
+                    elif square[1] == "p":
+                        piecePositionScore = PawnScoreB[row][col]
+                    elif square[1] == "Q":
+                        piecePositionScore = QueenScore[row][col]
+                    score -= (pieceScore[square[1]] + piecePositionScore)
+    return score
+
@@ -1,5 +1,12 @@
+import copy
+import math
+import queue
+import sys
+import threading
+import time
 import pygame as p
 import ChessEngine
+import ChessBitboard
 import ChessAI as ai
 ##CONSTANTS
 p.init()
@@ -9,9 +16,19 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT
 DIMENSION = 8
 SQ_SIZE = BOARD_HEIGHT // DIMENSION
 MAX_FPS = 60
+ANIMATION_TIME = 0.25 # seconds a move takes to slide across the board, however far it goes
+THINKING_HEIGHT = 50 # foot of the move log panel kept for the thinking spinner
+GIL_SWITCH_INTERVAL = 0.001 # seconds the AI search thread may hold the GIL before the frame loop gets a turn (Python's default is 0.005)
 IMAGES = {}
+SURFACES = {} # board background and square highlights, drawn once by loadSurfaces
 colors = [p.Color("white"),p.Color("grey")]
 highlightCheck = True
+useBitboard = True # bitboard move generation; False uses the plain ChessEngine board
+aiTimeLimit = None # seconds per AI move; None searches to ChessAI.DEPTH
+aiPonder = False # after its move the AI searches the reply it expects while the human thinks
+openingBook = None # path of a book made with ChessBook.py build; the AI plays its moves before searching
+tablebaseDirectory = None # directory of tables made with ChessTablebase.py generate; the AI plays endgames from them
+searchStatsFile = None # path the search statistics of every AI move are appended to, one JSON line each
 
 ##
 ranksToRows = {"1": 7, "2": 6, "3": 5, "4": 4, "5": 3, "6": 2, "7": 1, "8": 0}
@@ -26,6 +43,251 @@ def loadImages():
     for piece in pieces:
         IMAGES[piece] = p.transform.scale(p.image.load(f"chess_set_3/{piece}.png"),(SQ_SIZE,SQ_SIZE))
 
+def loadSurfaces():
+    board = p.Surface((BOARD_WIDTH, BOARD_HEIGHT))
+    for r in range(DIMENSION):
+        for c in range(DIMENSION):
+            p.draw.rect(board, colors[(r + c) % 2], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
+    SURFACES["board"] = board
+    for name, color, alpha in (("selected", "lightblue", 150), ("move", "green", 50), ("capture", "red", 75), ("check", "red", 125)):
+        s = p.Surface((SQ_SIZE, SQ_SIZE))
+        s.set_alpha(alpha) # transparency
+        s.fill(p.Color(color))
+        SURFACES[name] = s
+
+def newGameState():
+    return ChessBitboard.BitboardGameState() if useBitboard else ChessEngine.GameState()
+
+
+class AISearch:
+    ## Runs ai.findBestMove in a thread on a copy of the game, so the frame loop keeps drawing and
+    ## handling events while the AI thinks. The move comes back through a queue that poll() reads.
+    ## cancel() stops the search at its next budget check and drops its move.
+    ## Pondering: startPonder searches the position after the reply the AI expects, with no time
+    ## limit, while the human thinks. If the human plays that reply, ponderhit turns it into the AI's
+    ## search, which gets what is left of aiTimeLimit; otherwise it is cancelled. Either way the
+    ## transposition table keeps what it found.
+
+    def __init__(self):
+        self.results = queue.Queue() # (search id, move)
+        self.thread = None
+        self.stopEvent = None
+        self.searchId = 0
+        self.pending = False # a search was started and its move is not taken yet
+        self.pondering = False # the running search is on the position after the expected reply
+        self.ponderKey = None # zobristKey of that position
+        self.startTime = 0.0
+        self.timer = None # stops a search after a ponder hit
+
+    def start(self, gs, ponderMove=None):
+        self.cancel()
+        if self.thread is not None:
+            self.thread.join() # a cancelled search stops within a few hundred nodes
+        snapshot = copy.deepcopy(gs)
+        if ponderMove is not None:
+            snapshot.makeMove(ponderMove)
+            self.ponderKey = snapshot.zobristKey
+        self.searchId += 1
+        self.stopEvent = threading.Event()
+        self.pending = True
+        self.pondering = ponderMove is not None
+        self.startTime = time.perf_counter()
+        self.thread = threading.Thread(target=self.search, args=(snapshot, self.searchId, self.stopEvent, self.pondering),
+                                       daemon=True)
+        self.thread.start()
+
+    def startPonder(self, gs):
+        ## ponders the hash move of gs, the reply the last search expects; nothing when it has none
+        entry = ai.transpositionTable.probe(gs.zobristKey)
+        if entry is None or entry[3] is None:
+            return
+        for move in gs.getValidMove():
+            if move.moveID == entry[3]:
+                self.start(gs, move)
+                return
+
+    def search(self, gs, searchId, stopEvent, ponder):
+        validMoves = gs.getValidMove()
+        if ponder: # until ponderhit's timer or a cancel, or to the usual depth when moves are not timed
+            timeLimit, maxDepth = None, ai.DEPTH if aiTimeLimit is None else ai.MAX_DEPTH
+        else:
+            timeLimit, maxDepth = aiTimeLimit, None
+        move = ai.findBestMove(gs, validMoves, timeLimit=timeLimit, maxDepth=maxDepth, stopEvent=stopEvent)
+        if move is None:
+            move = ai.findRandomMoves(validMoves)
+        self.results.put((searchId, move))
+
+    def poll(self):
+        ## the move of the running search once it is found, else None
+        while True:
+            try:
+                searchId, move = self.results.get_nowait()
+            except queue.Empty:
+                return None
+            if searchId == self.searchId and self.pending:
+                self.pending = False
+                self.cancelTimer()
+                return move
+
+    def ponderhit(self):
+        ## the human played the expected reply: the ponder search goes on as the AI's search
+        self.pondering = False
+        if aiTimeLimit is not None:
+            remaining = aiTimeLimit - (time.perf_counter() - self.startTime)
+            self.timer = threading.Timer(max(0.0, remaining), self.stop, args=(self.stopEvent,))
+            self.timer.daemon = True
+            self.timer.start()
+
+    def stop(self, stopEvent):
+        ## ends the search of stopEvent; its move still comes through poll
+        stopEvent.set()
+
+    def cancelTimer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def cancel(self):
+        self.cancelTimer()
+        if self.pending:
+            self.stop(self.stopEvent)
+            self.pending = False
+        self.pondering = False
+
+
+class BoardRenderer:
+    ## Draws the game onto the screen and remembers what it drew, so a frame redraws only the squares,
+    ## move log lines and spinner that changed and update() sends just their rectangles to the display.
+    ## A frame where nothing changed draws nothing. invalidate() after anything else draws on the screen.
+    ## animate() slides the piece of a move to its square over ANIMATION_TIME while the frame loop goes on,
+    ## redrawing only the squares under the piece.
+
+    def __init__(self, screen, moveLogFont, endGameFont):
+        self.screen = screen
+        self.moveLogFont = moveLogFont
+        self.endGameFont = endGameFont
+        self.logRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT - THINKING_HEIGHT)
+        self.thinkingRect = p.Rect(BOARD_WIDTH, MOVE_LOG_PANEL_HEIGHT - THINKING_HEIGHT, MOVE_LOG_PANEL_WIDTH, THINKING_HEIGHT)
+        self.lineHeight = moveLogFont.get_height() + 4
+        self.thinkingText = moveLogFont.render("Thinking", True, p.Color("white"))
+        self.logMoves = [] # moves of the rendered lines
+        self.logLines = [] # rendered move log lines, a move of each side on each
+        self.dirty = [] # rectangles drawn since the last update
+        self.animation = None # move being animated
+        self.animationStart = 0.0
+        self.spriteRect = None # where the animated piece was drawn last
+        self.invalidate()
+
+    def animate(self, move):
+        ## starts animating move, which is already made on the board; None stops any animation
+        self.animation = move
+        self.animationStart = time.perf_counter()
+
+    def invalidate(self):
+        self.stateKey = None # what the board was drawn from
+        self.squareViews = [None] * 64 # (piece, highlights) drawn on every square
+        self.endText = None
+        self.logDrawn = False
+        self.spinnerStep = -1 # None when the spinner is hidden
+
+    def drawGameState(self, gs, validMoves, sqSelected, thinking, endText):
+        if self.animation is not None and time.perf_counter() - self.animationStart >= ANIMATION_TIME:
+            self.animation = None
+        if self.animation is not None:
+            endText = None # shown once the move has landed
+        self.drawSquares(gs, validMoves, sqSelected, endText)
+        self.drawMoveLog(gs.moveLog)
+        self.drawThinking(thinking)
+
+    def update(self):
+        if self.dirty:
+            p.display.update(self.dirty)
+            self.dirty = []
+
+    def drawSquares(self, gs, validMoves, sqSelected, endText):
+        move = self.animation
+        spriteRect = None
+        if move is not None:
+            progress = min(1.0, (time.perf_counter() - self.animationStart) / ANIMATION_TIME)
+            spriteRect = p.Rect(round((move.startCol + (move.endCol - move.startCol) * progress) * SQ_SIZE),
+                                round((move.startRow + (move.endRow - move.startRow) * progress) * SQ_SIZE), SQ_SIZE, SQ_SIZE)
+        under = squaresUnder(self.spriteRect) | squaresUnder(spriteRect) # uncovered or covered by the animated piece
+        key = (bytes(gs.squares), gs.whiteToMove, id(validMoves), sqSelected, endText, move)
+        if key == self.stateKey and not under:
+            return
+        views = self.squareViews
+        if key != self.stateKey:
+            self.stateKey = key
+            views = squareViews(gs, validMoves, sqSelected)
+            if move is not None: # the piece is still on its way, so its square shows what it captures
+                endSq = move.startRow * 8 + move.endCol if move.isEnpassantMove else move.endRow * 8 + move.endCol
+                views[move.endRow * 8 + move.endCol] = ("--", views[move.endRow * 8 + move.endCol][1])
+                views[endSq] = (move.pieceCaptured, views[endSq][1])
+        changed = [sq for sq in range(64) if views[sq] != self.squareViews[sq] or sq in under]
+        if endText != self.endText or (endText is not None and changed):
+            changed = range(64) # the text lies across the middle of the board
+        for sq in changed:
+            piece, highlights = views[sq]
+            rect = p.Rect(sq % 8 * SQ_SIZE, sq // 8 * SQ_SIZE, SQ_SIZE, SQ_SIZE)
+            self.screen.blit(SURFACES["board"], rect, rect)
+            for name in highlights:
+                self.screen.blit(SURFACES[name], rect)
+            if piece != "--":
+                self.screen.blit(IMAGES[piece], rect)
+            if len(changed) < 64:
+                self.dirty.append(rect)
+        if len(changed) == 64:
+            if endText is not None:
+                drawEndGameText(self.screen, endText, self.endGameFont)
+            self.dirty.append(p.Rect(0, 0, BOARD_WIDTH, BOARD_HEIGHT))
+        if spriteRect is not None:
+            self.screen.blit(IMAGES[move.pieceMoved], spriteRect)
+        self.spriteRect = spriteRect
+        self.squareViews = views
+        self.endText = endText
+
+    def drawMoveLog(self, moveLog):
+        shown = self.logMoves
+        if self.logDrawn and len(moveLog) == len(shown) and (not shown or moveLog[-1] is shown[-1]):
+            return
+        same = 0 # moves still shown as they are, the lines after them are rendered again
+        while same < min(len(moveLog), len(shown)) and moveLog[same] is shown[same]:
+            same += 1
+        del self.logLines[same // 2:]
+        for i in range(same // 2 * 2, len(moveLog), 2):
+            moveString = f"{str(i//2 + 1)}. {str(moveLog[i])}  "
+            if i + 1 < len(moveLog):
+                moveString += str(moveLog[i+1])
+            self.logLines.append(self.moveLogFont.render(moveString, True, p.Color("white")))
+        self.logMoves = list(moveLog)
+        padding = 5
+        visible = (self.logRect.height - padding) // self.lineHeight
+        p.draw.rect(self.screen, p.Color("black"), self.logRect)
+        textY = padding
+        for textObject in self.logLines[-visible:]: # scrolled to the latest moves once the panel is full
+            self.screen.blit(textObject, self.logRect.move(5, textY))
+            textY += self.lineHeight
+        self.dirty.append(self.logRect)
+        self.logDrawn = True
+
+    def drawThinking(self, thinking):
+        ## "Thinking" with a spinner at the foot of the move log, turned by the clock rather than by a frame count
+        step = p.time.get_ticks() // 100 % 8 if thinking else None
+        if step == self.spinnerStep:
+            return
+        self.spinnerStep = step
+        p.draw.rect(self.screen, p.Color("black"), self.thinkingRect)
+        if thinking:
+            x = BOARD_WIDTH + 20
+            y = MOVE_LOG_PANEL_HEIGHT - 25
+            for i in range(8):
+                angle = math.pi * i / 4
+                shade = 255 - 28 * ((step - i) % 8)
+                p.draw.circle(self.screen, (shade, shade, shade), (x + int(9 * math.cos(angle)), y + int(9 * math.sin(angle))), 3)
+            self.screen.blit(self.thinkingText, (x + 20, y - self.thinkingText.get_height() // 2))
+        self.dirty.append(self.thinkingRect)
+
+
 def main():
     p.init()
     screen = p.display.set_mode((BOARD_WIDTH + MOVE_LOG_PANEL_WIDTH,BOARD_HEIGHT))
@@ -34,15 +296,27 @@ def main():
     screen.fill(p.Color("white"))
     endGameFont = p.font.SysFont("Cambria Math", 30, True, False)
     moveLogFont = p.font.SysFont("Cambria Math", 20, False, False)
-    gs = ChessEngine.GameState()
+    gs = newGameState()
     validMoves = gs.getValidMove()
     moveMade = False
     animated = True
     loadImages() # Only gets loaded once
+    loadSurfaces()
+    renderer = BoardRenderer(screen, moveLogFont, endGameFont)
+    if openingBook:
+        ai.loadOpeningBook(openingBook)
+    if tablebaseDirectory:
+        ai.loadTablebases(tablebaseDirectory)
+    if searchStatsFile:
+        ai.searchHooks.append(lambda gs, move, stats: ai.writeSearchStats(
+            searchStatsFile, stats, ply=len(gs.moveLog), move=move.getUciNotation() if move is not None else None))
+    aiSearch = AISearch()
+    sys.setswitchinterval(GIL_SWITCH_INTERVAL)
     running = True
     sqSelected = () # (row, col)
     playerClicks = [] # [(row1, col1), (row2, col2)]
     gameOver = False
+    drawReason = None # "stalemate", "fifty-move rule" or "threefold repetition" once the game is drawn
     playAsWhite = True # if set to True, then human is playing. Else, AI is playing.
     playAsBlack = True
 
@@ -50,7 +324,10 @@ def main():
         isHumanTurn = (gs.whiteToMove and playAsWhite) or (not gs.whiteToMove and playAsBlack)
         for e in p.event.get():
             if e.type == p.QUIT:
+                aiSearch.cancel()
                 running = False
+            elif e.type == p.VIDEOEXPOSE: # the window was uncovered, the display needs all of it again
+                renderer.invalidate()
             elif e.type == p.MOUSEBUTTONDOWN:
                 if not gameOver and isHumanTurn:
                     location = p.mouse.get_pos() #(x, y)
@@ -63,12 +340,13 @@ def main():
                         sqSelected = (row, col)
                         playerClicks.append(sqSelected)
                     if len(playerClicks) == 2:
-                        move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
+                        move = ChessEngine.Move(playerClicks[0], playerClicks[1], gs.squares)
                         for i in range(len(validMoves)):
                             tempMove = validMoves[i]
                             if move == validMoves[i]:
                                 if move.isPawnPromotion == True:
-                                    tempMove.promotionChoice = promotion(move,screen)
+                                    tempMove = tempMove.withPromotion(promotion(move,screen))
+                                    renderer.invalidate() # the choice was drawn over the board
 
 
                                 gs.makeMove(tempMove)
@@ -79,6 +357,7 @@ def main():
                             playerClicks = [sqSelected]
             elif e.type == p.KEYDOWN:
                 if e.key == p.K_z: # Undo
+                    aiSearch.cancel()
                     gs.undoMove()
                     if not isHumanTurn:
                         gs.undoMove()
@@ -86,142 +365,88 @@ def main():
                     moveMade = True
                     gameOver = False
                 if e.key == p.K_r: # Reset
-                    gs = ChessEngine.GameState()
+                    aiSearch.cancel()
+                    gs = newGameState()
                     validMoves = gs.getValidMove()
+                    renderer.animate(None)
+                    drawReason = None
                     sqSelected = ()
                     playerClicks = []
                     moveMade = False
                     gameOver = False
                 if e.key == p.K_t: # Test
                     pass
-        ## Chess AI
-        if not gameOver and not isHumanTurn:
-            AIMove = ai.findBestMove(gs, validMoves)
-            if AIMove is None:
-                AIMove = ai.findRandomMoves(validMoves)
-            gs.makeMove(AIMove)
-            moveMade = True
+        ## Chess AI, searching in the background while frames keep coming
+        isHumanTurn = (gs.whiteToMove and playAsWhite) or (not gs.whiteToMove and playAsBlack)
+        if not gameOver and not isHumanTurn and not moveMade:
+            if aiSearch.pondering: # the human has moved
+                if aiSearch.ponderKey == gs.zobristKey:
+                    aiSearch.ponderhit()
+                else:
+                    aiSearch.cancel()
+            if not aiSearch.pending:
+                aiSearch.start(gs)
+            AIMove = aiSearch.poll()
+            if AIMove is not None:
+                gs.makeMove(AIMove)
+                moveMade = True
+                if aiPonder and ((gs.whiteToMove and playAsWhite) or (not gs.whiteToMove and playAsBlack)):
+                    aiSearch.startPonder(gs)
 
 
 
         if moveMade:
             validMoves = gs.getValidMove()
-            if gs.moveLog and animated:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+            drawReason = gs.drawReason()
+            renderer.animate(gs.moveLog[-1] if gs.moveLog and animated else None) # the frame loop and the AI go on while it slides
             moveMade = False
             animated = True
 
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
-
+        endText = None
         if gs.checkMate:
+            endText = "Black wins" if gs.whiteToMove else "White wins"
+        elif drawReason is not None:
+            endText = f"Draw by {drawReason}"
+        if endText is not None and not gameOver:
             gameOver = True
-            if gs.staleMate:
-                text = "Draw"
-            else:
-                text = "Black wins" if gs.whiteToMove else "White wins"
-            drawEndGameText(screen,text,endGameFont)
+            aiSearch.cancel() # the AI may have started pondering before it saw the game end
+        renderer.drawGameState(gs, validMoves, sqSelected, aiSearch.pending and not aiSearch.pondering, endText)
 
         clock.tick(MAX_FPS)
-        p.display.flip()
+        renderer.update()
+    aiSearch.cancel()
 
 ## ALL GRAPHICS HERE
-def drawGameState(screen, gs, validMoves, sqSelected,moveLogFont):
-    drawBoard(screen)
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen,gs.board)
-    drawMoveLog(screen,gs,moveLogFont)
-
-def drawBoard(screen):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            color = colors[((r+c)%2)]
-            p.draw.rect(screen,color,p.Rect(c*SQ_SIZE,r*SQ_SIZE,SQ_SIZE,SQ_SIZE))
-def highlightSquares(screen, gs, validMoves, sqSelected):
+def squaresUnder(rect):
+    ## squares a rectangle of the board overlaps
+    if rect is None:
+        return set()
+    rows = range(max(0, rect.top // SQ_SIZE), min(DIMENSION - 1, (rect.bottom - 1) // SQ_SIZE) + 1)
+    cols = range(max(0, rect.left // SQ_SIZE), min(DIMENSION - 1, (rect.right - 1) // SQ_SIZE) + 1)
+    return {r * 8 + c for r in rows for c in cols}
+def squareViews(gs, validMoves, sqSelected):
+    ## (piece, highlight names) of every square, in the order the highlights are drawn
+    board = gs.board
+    highlights = [[] for sq in range(64)]
     if sqSelected != ():
         r, c = sqSelected
-        if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"):
-            ## Highlight
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(150) # transparency
-            s.fill(p.Color("lightblue"))
-            screen.blit(s, (c*SQ_SIZE, r* SQ_SIZE))
-
-
+        if board[r][c][0] == ("w" if gs.whiteToMove else "b"):
+            highlights[r * 8 + c].append("selected")
             for move in validMoves:
                 if move.startRow == r and move.startCol == c:
-                    if move.pieceCaptured == "--":
-                        s.fill(p.Color("green"))
-                        s.set_alpha(50)
-                        screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
-                    else:
-                        s.fill(p.Color("red"))
-                        s.set_alpha(75)
-                        screen.blit(s, (move.endCol * SQ_SIZE, move.endRow * SQ_SIZE))
+                    highlights[move.endRow * 8 + move.endCol].append("move" if move.pieceCaptured == "--" else "capture")
     ## highlight check
     if highlightCheck:
         if gs.inCheck():
-            r = gs.whiteKingLocation[0] if gs.whiteToMove else gs.blackKingLocation[0]
-            c = gs.whiteKingLocation[1] if gs.whiteToMove else gs.blackKingLocation[1]
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(125)  # transparency
-            s.fill(p.Color("red"))
-            screen.blit(s, (c * SQ_SIZE, r * SQ_SIZE))
-def drawPieces(screen,board):
-    for r in range(DIMENSION):
-        for c in range(DIMENSION):
-            piece = board[r][c]
-            if piece != "--":
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE,r*SQ_SIZE,SQ_SIZE,SQ_SIZE))
+            r, c = gs.whiteKingLocation if gs.whiteToMove else gs.blackKingLocation
+            highlights[r * 8 + c].append("check")
+    return [(board[sq // 8][sq % 8], tuple(highlights[sq])) for sq in range(64)]
 def drawEndGameText(screen, text, font):
     textObject = font.render(text, 0, p.Color("Gray"))
     textLocation = p.Rect(0,0,BOARD_WIDTH,BOARD_HEIGHT).move(BOARD_WIDTH/2 - textObject.get_width()/2, BOARD_HEIGHT/2 - textObject.get_height()/2)
     screen.blit(textObject,textLocation)
     textObject2 = font.render(text, 0, p.Color("Black"))
     screen.blit(textObject2, textLocation.move(2,2))
-def drawMoveLog(screen,gs,font):
-    moveLogRect = p.Rect(BOARD_WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT)
-    p.draw.rect(screen, p.Color("black"), moveLogRect)
-    moveLog = gs.moveLog
-    moveTexts = []
-    for i in range(0, len(moveLog),2):
-        moveString = f"{str(i//2 + 1)}. {str(moveLog[i])}  "
-        if i + 1 < len(moveLog):
-            moveString += str(moveLog[i+1])
-        moveTexts.append(moveString)
-    padding = 5
-    lineSpacing = 4
-    textY = padding
-    for i in range(len(moveTexts)):
-        text = str(moveTexts[i])
-        textObject = font.render(text, True, p.Color("white"))
-        textLocation = moveLogRect.move(5,textY)
-        screen.blit(textObject, textLocation)
-        textY += textObject.get_height() + lineSpacing
-
-    
-
-
-def animateMove(move,screen,board,clock):
-    deltaR = move.endRow - move.startRow
-    deltaC = move.endCol - move.startCol
-    framesPerSquare = 120 // (abs(deltaR) + abs(deltaC))
-
-    frameCount = (abs(deltaR) + abs(deltaC)) * framesPerSquare
-    for frame in range(frameCount + 1):
-        r,c = (move.startRow + deltaR * frame/frameCount, move.startCol + deltaC * frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        # erase the piece
-        color = colors[(move.endRow + move.endCol) % 2]
-        endSquare = p.Rect(move.endCol * SQ_SIZE, move.endRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        if move.pieceCaptured != "--":
-            if move.isEnpassantMove:
-                enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == "b" else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE,SQ_SIZE)
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c * SQ_SIZE, r * SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
 ## Promotion Choice
 def promotion(move,screen):
     c = move.endCol
@@ -0,0 +1,268 @@
+import argparse
+import math
+import multiprocessing
+import sys
+import time
+from datetime import date
+
+import ChessAI
+import ChessBitboard
+import ChessEngine
+import ChessPGN
+from ChessUCI import findMove, timeBudget
+
+## Headless self-play between two engine configurations, to tell whether a change gains strength.
+## Every opening is played twice with colours swapped, games run in worker processes, and the score of
+## the first engine is turned into an Elo difference with a 95% error bar and an optional SPRT.
+DEFAULT_OPENINGS = [ # coordinate moves from the start position, a spread of common openings
+    "e2e4 e7e5", "e2e4 c7c5", "e2e4 e7e6", "e2e4 c7c6", "d2d4 d7d5", "d2d4 g8f6 c2c4 e7e6",
+    "d2d4 g8f6 c2c4 g7g6", "c2c4 e7e5", "g1f3 d7d5", "e2e4 e7e5 g1f3 b8c6 f1b5", "e2e4 d7d5", "d2d4 d7d5 c2c4 c7c6",
+]
+DEFAULT_NODES = 5000 # search budget per move of an engine given no nodes, depth, movetime or tc
+MAX_PLIES = 400 # longer games are adjudicated a draw
+ENGINE_SETTINGS = {"name": str, "nodes": int, "depth": int, "movetime": float, "hash": int}
+OPTION_DEFAULTS = {name: getattr(ChessAI, name) for name in dir(ChessAI) if name.isupper()}
+
+def parseValue(text):
+    if text.lower() in ("true", "false"):
+        return text.lower() == "true"
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+def parseTimeControl(text):
+    ## "40+0.5": seconds on the clock + increment per move
+    base, _, increment = text.partition("+")
+    return float(base), float(increment or 0)
+
+def parseEngine(tokens, number):
+    ## key=value settings of one engine: name, nodes, depth, movetime (s), tc (base+increment s), hash (MB),
+    ## and any upper-case ChessAI setting such as QUIESCENCE=false or DELTA_MARGIN=2
+    config = {"name": f"engine{number}", "nodes": None, "depth": None, "movetime": None, "tc": None, "hash": 4,
+              "options": {}}
+    for token in tokens:
+        key, sep, value = token.partition("=")
+        if not sep:
+            raise SystemExit(f"engine setting {token} is not key=value")
+        if key in ENGINE_SETTINGS:
+            config[key] = ENGINE_SETTINGS[key](value)
+        elif key == "tc":
+            config["tc"] = parseTimeControl(value)
+        elif key in OPTION_DEFAULTS:
+            config["options"][key] = parseValue(value)
+        else:
+            raise SystemExit(f"unknown engine setting {key}")
+    if config["nodes"] is None and config["depth"] is None and config["movetime"] is None and config["tc"] is None:
+        config["nodes"] = DEFAULT_NODES
+    return config
+
+def readOpenings(path):
+    ## (FEN or None, [coordinate moves]) per line: a FEN (optionally followed by ; and EPD opcodes) or a move list
+    openings = []
+    lines = open(path) if path else DEFAULT_OPENINGS
+    for line in lines:
+        line = line.split(";")[0].strip()
+        if not line or line.startswith("#"):
+            continue
+        openings.append((line, []) if "/" in line else (None, line.split()))
+    if path:
+        lines.close()
+    return openings
+
+def insufficientMaterial(gs):
+    ## only kings, or kings and a single knight or bishop
+    pieces = [code & ChessEngine.PIECE_TYPE for code in gs.squares if code & ChessEngine.PIECE_TYPE not in (0, ChessEngine.KING)]
+    return len(pieces) == 0 or (len(pieces) == 1 and pieces[0] in (ChessEngine.KNIGHT, ChessEngine.BISHOP))
+
+## per worker: one transposition table per engine, kept between games and cleared at the start of each
+engineTables = {}
+
+def engineTable(config):
+    key = (config["name"], config["hash"])
+    if key not in engineTables:
+        engineTables[key] = ChessAI.TranspositionTable(config["hash"])
+    return engineTables[key]
+
+def applyOptions(config, optionNames):
+    for name in optionNames:
+        setattr(ChessAI, name, config["options"].get(name, OPTION_DEFAULTS[name]))
+
+def playGame(task):
+    ## runs in a worker: one game from an opening; returns the result and the PGN text
+    gameNumber, opening, white, black, seed, maxPlies = task
+    engines = [white, black]
+    optionNames = set(white["options"]) | set(black["options"])
+    tables = [engineTable(white), engineTable(black)]
+    for table in tables:
+        table.clear()
+    gs = ChessBitboard.BitboardGameState()
+    fen, openingMoves = opening
+    if fen:
+        gs.loadFen(fen)
+    firstPly = gs.startPly
+    sanMoves = []
+    for notation in openingMoves:
+        move = findMove(gs, notation)
+        if move is None:
+            raise ValueError(f"illegal opening move {notation} in {' '.join(openingMoves)}")
+        sanMoves.append(gs.getSanNotation(move))
+        gs.makeMove(move)
+    clocks = [config["tc"][0] if config["tc"] else None for config in engines]
+    moveStats = [] # SearchContext.statistics of every searched move
+    result = None
+    while result is None:
+        validMoves = gs.getValidMove()
+        drawReason = gs.drawReason()
+        if gs.checkMate:
+            result, termination, reason = ("0-1" if gs.whiteToMove else "1-0"), "normal", "checkmate"
+        elif drawReason is not None:
+            result, termination, reason = "1/2-1/2", "normal", drawReason
+        elif insufficientMaterial(gs):
+            result, termination, reason = "1/2-1/2", "normal", "insufficient material"
+        elif len(sanMoves) >= maxPlies:
+            result, termination, reason = "1/2-1/2", "adjudication", "move limit"
+        if result is not None:
+            break
+        side = 0 if gs.whiteToMove else 1
+        config = engines[side]
+        applyOptions(config, optionNames)
+        timeLimit = config["movetime"]
+        if config["tc"]:
+            timeLimit = timeBudget(clocks[side] * 1000, config["tc"][1] * 1000, None)
+        context = ChessAI.SearchContext(table=tables[side], seed=seed * 1000 + len(sanMoves))
+        startTime = time.perf_counter()
+        move = context.search(gs, validMoves, timeLimit, config["nodes"], config["depth"])
+        elapsed = time.perf_counter() - startTime
+        if move is None:
+            move = validMoves[0]
+        moveStats.append(dict(context.statistics(), game=gameNumber, ply=len(sanMoves), engine=config["name"],
+                              move=move.getUciNotation()))
+        if config["tc"]:
+            clocks[side] -= elapsed
+            if clocks[side] < 0:
+                result, termination, reason = ("0-1" if side == 0 else "1-0"), "time forfeit", "time forfeit"
+                break
+            clocks[side] += config["tc"][1]
+        sanMoves.append(gs.getSanNotation(move, validMoves))
+        gs.makeMove(move)
+    headers = {"Event": "PyChess match", "Site": "local", "Date": date.today().strftime("%Y.%m.%d"), "Round": gameNumber + 1,
+               "White": white["name"], "Black": black["name"], "Termination": termination, "PlyCount": len(sanMoves)}
+    if white["tc"] or black["tc"]:
+        headers["TimeControl"] = "-" if white["tc"] != black["tc"] else f"{white['tc'][0]:g}+{white['tc'][1]:g}"
+    if fen:
+        headers["SetUp"] = "1"
+        headers["FEN"] = fen
+    return {"game": gameNumber, "white": white["name"], "black": black["name"], "result": result, "reason": reason,
+            "plies": len(sanMoves), "pgn": ChessPGN.formatGame(headers, sanMoves, result, firstPly), "moveStats": moveStats}
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return 400 * math.log10(score / (1 - score))
+
+def matchStats(wins, draws, losses):
+    ## (Elo difference, 95% error margin, likelihood of superiority) from the first engine's results
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    elo = scoreToElo(score)
+    errorMargin = (scoreToElo(score + margin) - scoreToElo(score - margin)) / 2 if variance else math.inf # no spread yet
+    los = 0.5 * (1 + math.erf((wins - losses) / math.sqrt(2 * (wins + losses)))) if wins + losses else 0.5
+    return elo, errorMargin, los
+
+def sprtLLR(wins, draws, losses, elo0, elo1):
+    ## log likelihood ratio of H1 (elo1) against H0 (elo0), normal approximation of the trinomial results
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0
+    score0 = 1 / (1 + 10 ** (-elo0 / 400))
+    score1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+def gameTasks(engines, openings, games, seed, maxPlies):
+    ## each opening twice, the first engine with white and then with black
+    for gameNumber in range(games):
+        opening = openings[gameNumber // 2 % len(openings)]
+        white, black = engines if gameNumber % 2 == 0 else engines[::-1]
+        yield gameNumber, opening, white, black, seed + gameNumber, maxPlies
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play two engine configurations against each other")
+    parser.add_argument("--engine", action="append", nargs="+", required=True, metavar="KEY=VALUE",
+                        help="settings of one engine (give it twice): name, nodes, depth, movetime, tc, hash, ChessAI settings")
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--openings", help="file of FENs or coordinate move lists, one per line")
+    parser.add_argument("--pgn", help="append every game to this PGN file")
+    parser.add_argument("--stats", help="append the search statistics of every move to this file, one JSON line each")
+    parser.add_argument("--max-plies", type=int, default=MAX_PLIES)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"), help="stop once H0 or H1 is accepted")
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args(argv)
+    if len(args.engine) != 2:
+        parser.error("give --engine exactly twice")
+    engines = [parseEngine(tokens, i + 1) for i, tokens in enumerate(args.engine)]
+    if engines[0]["name"] == engines[1]["name"]:
+        parser.error("the two engines need different names")
+    openings = readOpenings(args.openings)
+    lowerBound = math.log(args.beta / (1 - args.alpha))
+    upperBound = math.log((1 - args.beta) / args.alpha)
+    tasks = gameTasks(engines, openings, args.games, args.seed, args.max_plies)
+    pool = multiprocessing.Pool(args.workers) if args.workers > 1 else None
+    results = pool.imap_unordered(playGame, tasks) if pool is not None else map(playGame, tasks)
+    pgnFile = open(args.pgn, "a") if args.pgn else None
+    name = engines[0]["name"]
+    wins = draws = losses = played = 0
+    verdict = None
+    try:
+        for game in results:
+            played += 1
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == name):
+                wins += 1
+            else:
+                losses += 1
+            if pgnFile is not None:
+                pgnFile.write(game["pgn"])
+                pgnFile.flush()
+            if args.stats:
+                for stats in game["moveStats"]:
+                    ChessAI.writeSearchStats(args.stats, stats)
+            elo, errorMargin, los = matchStats(wins, draws, losses)
+            line = (f"game {played}/{args.games} {game['white']} - {game['black']} {game['result']} ({game['reason']}, "
+                    f"{game['plies']} plies)  {name} +{wins} ={draws} -{losses}  Elo {elo:+.1f} +/- {errorMargin:.1f}  "
+                    f"LOS {los:.1%}")
+            if args.sprt:
+                llr = sprtLLR(wins, draws, losses, args.sprt[0], args.sprt[1])
+                line += f"  LLR {llr:.2f} ({lowerBound:.2f}, {upperBound:.2f})"
+                if llr >= upperBound:
+                    verdict = f"H1 accepted: {name} is at least {args.sprt[1]:g} Elo stronger"
+                elif llr <= lowerBound:
+                    verdict = f"H0 accepted: {name} is not {args.sprt[1]:g} Elo stronger (at most {args.sprt[0]:g})"
+            print(line, flush=True)
+            if verdict:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        if pgnFile is not None:
+            pgnFile.close()
+    print(f"{engines[0]['name']} vs {engines[1]['name']}: +{wins} ={draws} -{losses} in {played} games")
+    if played:
+        elo, errorMargin, los = matchStats(wins, draws, losses)
+        print(f"Elo {elo:+.1f} +/- {errorMargin:.1f} (95%), LOS {los:.1%}")
+    if args.sprt:
+        print(f"SPRT: {verdict or 'no decision, more games needed'}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,80 @@
+## PGN games: the seven tag roster first, then any other headers, then the movetext wrapped at 80 columns.
+TAG_ROSTER = ["Event", "Site", "Date", "Round", "White", "Black", "Result"]
+LINE_LENGTH = 80
+
+def formatGame(headers, sanMoves, result, firstPly=0):
+    ## PGN text of one game; firstPly is the ply the moves start at (odd when black moves first)
+    lines = []
+    for name in TAG_ROSTER + [name for name in headers if name not in TAG_ROSTER]:
+        value = str(result if name == "Result" else headers.get(name, "?"))
+        value = value.replace("\\", "\\\\").replace('"', '\\"')
+        lines.append(f'[{name} "{value}"]')
+    lines.append("")
+    tokens = []
+    for i, san in enumerate(sanMoves):
+        ply = firstPly + i
+        if ply % 2 == 0:
+            tokens.append(f"{ply // 2 + 1}.")
+        elif i == 0:
+            tokens.append(f"{ply // 2 + 1}...")
+        tokens.append(san)
+    tokens.append(result)
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+
+def readGames(lines):
+    ## (headers, [SAN moves], result) of every game in an iterable of PGN lines, one game at a time.
+    ## Comments, variations, NAGs and move numbers are dropped.
+    headers = {}
+    moves = []
+    depth = 0 # open variations
+    inComment = False
+    for line in lines:
+        line = line.strip()
+        if not inComment and depth == 0 and line.startswith("["):
+            if moves: # movetext without a result, the tag starts the next game
+                yield headers, moves, "*"
+                headers, moves = {}, []
+            name, _, value = line[1:].rstrip("]").partition(" ")
+            value = value.strip()
+            if len(value) >= 2 and value[0] == value[-1] == '"':
+                value = value[1:-1]
+            headers[name] = value.replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if line.startswith("%"): # escape line
+            continue
+        token = ""
+        for char in line + " ":
+            if inComment:
+                inComment = char != "}"
+                continue
+            if not char.isspace() and char not in "{};()":
+                token += char
+                continue
+            token = token.split(".")[-1] # "12.e4" and "12...e4"
+            if token and depth == 0:
+                if token in RESULTS:
+                    yield headers, moves, token
+                    headers, moves = {}, []
+                elif not token.startswith("$"):
+                    moves.append(token)
+            token = ""
+            if char == "{":
+                inComment = True
+            elif char == ";":
+                break # the rest of the line is a comment
+            elif char == "(":
+                depth += 1
+            elif char == ")":
+                depth = max(0, depth - 1)
+    if moves:
+        yield headers, moves, "*"
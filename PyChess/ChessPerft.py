@@ -0,0 +1,301 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+
+import ChessAI
+import ChessEngine
+import ChessBitboard
+from ChessEngine import MOVE_PROMOTION_MASK
+
+## Perft positions with known leaf counts by depth. The standard positions are from the Chess
+## Programming Wiki, the edge cases from Martin Sedlak's perft suite (published at their deepest depth).
+POSITIONS = [
+    ("start", "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+     {1: 20, 2: 400, 3: 8902, 4: 197281, 5: 4865609}),
+    ("kiwipete", "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+     {1: 48, 2: 2039, 3: 97862, 4: 4085603}),
+    ("position3", "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+     {1: 14, 2: 191, 3: 2812, 4: 43238, 5: 674624}),
+    ("position4", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+     {1: 6, 2: 264, 3: 9467, 4: 422333}),
+    ("position5", "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+     {1: 44, 2: 1486, 3: 62379, 4: 2103487}),
+    ("position6", "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+     {1: 46, 2: 2079, 3: 89890, 4: 3894594}),
+    ("illegalEnpassant1", "3k4/3p4/8/K1P4r/8/8/8/8 b - - 0 1",
+     {1: 18, 2: 92, 3: 1670, 4: 10138, 5: 185429, 6: 1134888}),
+    ("illegalEnpassant2", "8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1",
+     {1: 13, 2: 102, 3: 1266, 4: 10276, 5: 135655, 6: 1015133}),
+    ("enpassantCheck", "8/8/1k6/2b5/2pP4/8/5K2/8 b - d3 0 1",
+     {1: 15, 2: 126, 3: 1928, 4: 13931, 5: 206379, 6: 1440467}),
+    ("shortCastleCheck", "5k2/8/8/8/8/8/8/4K2R w K - 0 1",
+     {1: 15, 2: 66, 3: 1198, 4: 6399, 5: 120330, 6: 661072}),
+    ("longCastleCheck", "3k4/8/8/8/8/8/8/R3K3 w Q - 0 1",
+     {1: 16, 2: 71, 3: 1286, 4: 7418, 5: 141077, 6: 803711}),
+    ("castleRights", "r3k2r/1b4bq/8/8/8/8/7B/R3K2R w KQkq - 0 1",
+     {1: 26, 2: 1141, 3: 27826, 4: 1274206}),
+    ("castlePrevented", "r3k2r/8/3Q4/8/8/5q2/8/R3K2R b KQkq - 0 1",
+     {1: 44, 2: 1494, 3: 50509, 4: 1720476}),
+    ("promoteOutOfCheck", "2K2r2/4P3/8/8/8/8/8/3k4 w - - 0 1",
+     {1: 11, 2: 133, 3: 1442, 4: 19174, 5: 266199, 6: 3821001}),
+    ("discoveredCheck", "8/8/1P2K3/8/2n5/1q6/8/5k2 b - - 0 1",
+     {1: 29, 2: 165, 3: 5160, 4: 31961, 5: 1004658}),
+    ("promoteToCheck", "4k3/1P6/8/8/8/8/K7/8 w - - 0 1",
+     {1: 9, 2: 40, 3: 472, 4: 2661, 5: 38983, 6: 217342}),
+    ("underpromoteToCheck", "8/P1k5/K7/8/8/8/8/8 w - - 0 1",
+     {1: 6, 2: 27, 3: 273, 4: 1329, 5: 18135, 6: 92683}),
+    ("selfStalemate", "K1k5/8/P7/8/8/8/8/8 w - - 0 1",
+     {1: 2, 2: 6, 3: 13, 4: 63, 5: 382, 6: 2217}),
+    ("stalemateCheckmate1", "8/k1P5/8/1K6/8/8/8/8 w - - 0 1",
+     {1: 10, 2: 25, 3: 268, 4: 926, 5: 10857, 6: 43261, 7: 567584}),
+    ("stalemateCheckmate2", "8/8/2k5/5q2/5n2/8/5K2/8 b - - 0 1",
+     {1: 37, 2: 183, 3: 6559, 4: 23527}),
+]
+PROMOTION_CHOICES = ["Q", "R", "B", "N"]
+BENCH_NODES = 200000 # bench searches each position to the deepest known count up to this many leaves
+
+def newGameState(backend, fen):
+    gs = ChessBitboard.BitboardGameState() if backend == "bitboard" else ChessEngine.GameState()
+    gs.loadFen(fen)
+    return gs
+
+def perft(gs, depth):
+    ## number of leaf nodes depth plies below gs; a promotion counts once for every piece
+    if depth == 0:
+        return 1
+    moves = gs.getValidMove()
+    if depth == 1:
+        return len(moves) + 3 * sum(1 for move in moves if move.packed & MOVE_PROMOTION_MASK)
+    nodes = 0
+    for move in moves:
+        if move.packed & MOVE_PROMOTION_MASK:
+            for choice in PROMOTION_CHOICES:
+                gs.makeMove(move.withPromotion(choice))
+                nodes += perft(gs, depth - 1)
+                gs.undoMove()
+        else:
+            gs.makeMove(move)
+            nodes += perft(gs, depth - 1)
+            gs.undoMove()
+    return nodes
+
+def divide(gs, depth):
+    ## [(move in coordinate notation, leaf nodes below it)] for every legal move of gs
+    results = []
+    for move in gs.getValidMove():
+        for choice in PROMOTION_CHOICES if move.isPawnPromotion else [move.promotionChoice]:
+            notation = move.getChessNotation() + (choice.lower() if move.isPawnPromotion else "")
+            gs.makeMove(move.withPromotion(choice) if move.isPawnPromotion else move)
+            results.append((notation, perft(gs, depth - 1)))
+            gs.undoMove()
+    return results
+
+def findPosition(name):
+    for position in POSITIONS:
+        if position[0] == name:
+            return position
+    raise SystemExit(f"unknown position {name}, choose from: {', '.join(p[0] for p in POSITIONS)}")
+
+def benchDepth(counts, maxNodes):
+    ## deepest depth with a known count of at most maxNodes, or the shallowest known depth
+    depths = [depth for depth, nodes in counts.items() if nodes <= maxNodes]
+    return max(depths) if depths else min(counts)
+
+def runPerft(args):
+    if args.position:
+        name, fen, counts = findPosition(args.position)
+    else:
+        fen, counts = args.fen, {}
+    gs = newGameState(args.backend, fen)
+    startTime = time.perf_counter()
+    if args.divide:
+        results = divide(gs, args.depth)
+        for notation, nodes in sorted(results):
+            print(f"{notation}: {nodes}")
+        nodes = sum(nodes for notation, nodes in results)
+        print()
+    else:
+        nodes = perft(gs, args.depth)
+    elapsed = time.perf_counter() - startTime
+    print(f"Nodes: {nodes}")
+    print(f"Time: {elapsed:.3f}s")
+    print(f"NPS: {nodes / elapsed:.0f}" if elapsed > 0 else "NPS: -")
+    expected = counts.get(args.depth)
+    if expected is not None:
+        print(f"Expected: {expected} {'ok' if nodes == expected else 'MISMATCH'}")
+        return 0 if nodes == expected else 1
+    return 0
+
+## Regression checks of what perft does not count. Each takes the backend name and returns None when it
+## passes, or what went wrong.
+def checkLostRoot(backend):
+    ## every move of a lost position scores as mated, the search must still return one at every depth
+    gs = newGameState(backend, "1k6/8/4q3/6K1/3r4/8/8/8 w - - 14 122")
+    for depth in range(1, 4):
+        move = ChessAI.SearchContext().search(gs, gs.getValidMove(), maxDepth=depth)
+        if move is None:
+            return f"no move at depth {depth}"
+    return None
+
+def checkStalemateScore(backend):
+    ## Qxf7 stalemates black; a stalemate inside the tree is a draw, not a mate that ends the deepening
+    gs = newGameState(backend, "7k/5r2/6K1/8/8/8/8/5Q2 w - - 0 1")
+    for depth in range(2, 5):
+        ChessAI.transpositionTable.clear()
+        move = ChessAI.SearchContext().search(gs, gs.getValidMove(), maxDepth=depth)
+        if move is None or move.getChessNotation() == "f1f7":
+            return f"played the stalemate at depth {depth}"
+    return None
+
+def playMoves(gs, moves):
+    ## plays moves in coordinate notation ("g1f3 g8f6"), then generates the moves of the position reached
+    ## so checkMate and staleMate are up to date
+    for notation in moves.split():
+        gs.makeMove(next(move for move in gs.getValidMove() if move.getChessNotation() == notation))
+    gs.getValidMove()
+
+def checkThreefold(backend):
+    ## a knight shuffle repeats the start position once after four plies and twice after eight
+    gs = newGameState(backend, findPosition("start")[1])
+    playMoves(gs, "g1f3 g8f6 f3g1 f6g8")
+    if (gs.repetitions(), gs.isRepetition(), gs.drawReason()) != (1, True, None):
+        return f"after 4 plies: {gs.repetitions()}, {gs.isRepetition()}, {gs.drawReason()}"
+    playMoves(gs, "g1f3 g8f6 f3g1 f6g8")
+    if (gs.repetitions(), gs.isRepetition(), gs.drawReason()) != (2, True, "threefold repetition"):
+        return f"after 8 plies: {gs.repetitions()}, {gs.isRepetition()}, {gs.drawReason()}"
+    return None
+
+def checkEnpassantRepetition(backend):
+    ## after e2e4 black may take en passant, after the king shuffle not: the same placement is not a repetition
+    gs = newGameState(backend, "4k3/8/8/8/3p4/8/4P3/4K3 w - - 0 1")
+    playMoves(gs, "e2e4 e8f8 e1f1 f8e8 f1e1")
+    if gs.repetitions() != 0 or gs.isRepetition():
+        return f"en passant right ignored: {gs.repetitions()} repetitions"
+    playMoves(gs, "e8f8 e1f1 f8e8 f1e1")
+    if gs.repetitions() != 1:
+        return f"{gs.repetitions()} repetitions after the second shuffle, expected 1"
+    return None
+
+def checkFiftyMoves(backend):
+    ## the 100th halfmove draws, unless it mates
+    fen = "4k3/R7/8/8/8/8/8/1Q2K3 w - - 99 80"
+    gs = newGameState(backend, fen)
+    playMoves(gs, "b1b8")
+    if not gs.checkMate or gs.drawReason() is not None:
+        return f"mate on the 100th halfmove scored as {gs.drawReason()}"
+    gs = newGameState(backend, fen)
+    playMoves(gs, "a7a6")
+    if gs.drawReason() != "fifty-move rule":
+        return f"quiet 100th halfmove gave {gs.drawReason()}"
+    gs = newGameState(backend, fen)
+    move = ChessAI.SearchContext().search(gs, gs.getValidMove(), maxDepth=1)
+    if move is None or move.getChessNotation() != "b1b8":
+        return f"search played {move.getChessNotation() if move is not None else None} instead of the mate"
+    return None
+
+def checkStrayCastlingRights(backend):
+    ## a right whose king or rook is off its home square is dropped on loading, so no castle is generated
+    gs = newGameState(backend, "4k3/8/8/8/8/8/8/6K1 w K - 0 1")
+    if gs.castlingRights != 0:
+        return f"castling rights {gs.castlingRights} kept without a king on e1"
+    gs = newGameState(backend, "r3k3/8/8/8/8/8/8/R3K1R1 w KQkq - 0 1")
+    if gs.toFen().split()[2] != "Qq":
+        return f"castling rights {gs.toFen().split()[2]} kept, expected Qq"
+    castles = [move.getChessNotation() for move in gs.getValidMove() if move.isCastleMove]
+    if castles != ["e1c1"]:
+        return f"castles {castles}, expected e1c1"
+    return None
+
+CHECKS = [("lostRoot", checkLostRoot), ("stalemateScore", checkStalemateScore), ("threefold", checkThreefold), ("enpassantRepetition", checkEnpassantRepetition),
+          ("fiftyMoves", checkFiftyMoves), ("strayCastlingRights", checkStrayCastlingRights)]
+
+def runCheck(args):
+    failures = 0
+    for name, check in CHECKS:
+        error = check(args.backend)
+        failures += error is not None
+        print(f"{name:22} {'ok' if error is None else f'FAILED {error}'}")
+    print(f"{len(CHECKS) - failures}/{len(CHECKS)} checks passed")
+    return 1 if failures else 0
+
+def runBench(args):
+    results = {"label": args.label, "backend": args.backend, "date": datetime.now().isoformat(timespec="seconds"),
+               "python": platform.python_version(), "maxNodes": args.nodes, "repeat": args.repeat, "positions": []}
+    failures = 0
+    totalNodes = 0
+    totalTime = 0.0
+    for name, fen, counts in POSITIONS:
+        depth = args.depth if args.depth is not None else benchDepth(counts, args.nodes)
+        elapsed = None
+        for _ in range(args.repeat): # best of repeat runs
+            gs = newGameState(args.backend, fen)
+            startTime = time.perf_counter()
+            nodes = perft(gs, depth)
+            runTime = time.perf_counter() - startTime
+            elapsed = runTime if elapsed is None else min(elapsed, runTime)
+        expected = counts.get(depth)
+        ok = expected is None or nodes == expected
+        failures += not ok
+        totalNodes += nodes
+        totalTime += elapsed
+        results["positions"].append({"name": name, "fen": fen, "depth": depth, "nodes": nodes, "expected": expected,
+                                     "ok": ok, "time": elapsed, "nps": nodes / elapsed if elapsed > 0 else 0.0})
+        print(f"{name:22} depth {depth}  {nodes:>9}  {elapsed:7.3f}s  {nodes / elapsed if elapsed > 0 else 0:9.0f} nps"
+              f"  {'ok' if ok else f'MISMATCH expected {expected}'}")
+    results["totalNodes"] = totalNodes
+    results["totalTime"] = totalTime
+    results["nps"] = totalNodes / totalTime if totalTime > 0 else 0.0
+    results["failures"] = failures
+    print(f"total {totalNodes} nodes in {totalTime:.3f}s, {results['nps']:.0f} nps, {failures} mismatches")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 1 if failures else 0
+
+def runCompare(args):
+    ## nodes per second of two bench results, position by position
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    before = {p["name"]: p for p in baseline["positions"]}
+    print(f"{'position':22} {baseline.get('label') or 'baseline':>12} {candidate.get('label') or 'candidate':>12}  speedup")
+    for position in candidate["positions"]:
+        old = before.get(position["name"])
+        if old is None or old["depth"] != position["depth"]:
+            continue
+        speedup = position["nps"] / old["nps"] if old["nps"] else 0.0
+        print(f"{position['name']:22} {old['nps']:12.0f} {position['nps']:12.0f}  {speedup:6.2f}x"
+              f"{'' if position['ok'] else '  MISMATCH'}")
+    if baseline["nps"]:
+        print(f"{'total':22} {baseline['nps']:12.0f} {candidate['nps']:12.0f}  {candidate['nps'] / baseline['nps']:6.2f}x")
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Perft and move generator benchmarks")
+    parser.add_argument("--backend", choices=["bitboard", "board"], default="bitboard")
+    commands = parser.add_subparsers(dest="command", required=True)
+    perftParser = commands.add_parser("perft", help="count the leaf nodes of one position")
+    perftParser.add_argument("depth", type=int)
+    source = perftParser.add_mutually_exclusive_group()
+    source.add_argument("--fen", default=POSITIONS[0][1])
+    source.add_argument("--position", help="name of a bundled position")
+    perftParser.add_argument("--divide", action="store_true", help="print the node count below every root move")
+    benchParser = commands.add_parser("bench", help="perft every bundled position and check the counts")
+    benchParser.add_argument("--nodes", type=int, default=BENCH_NODES, help="largest known count to search to")
+    benchParser.add_argument("--depth", type=int, help="search every position to this depth instead")
+    benchParser.add_argument("--repeat", type=int, default=1, help="keep the best time of this many runs")
+    benchParser.add_argument("--label", default="", help="name of this run in the JSON results")
+    benchParser.add_argument("--output", help="write the results as JSON to this file")
+    commands.add_parser("check", help="run the search and rules regression checks")
+    compareParser = commands.add_parser("compare", help="compare two bench JSON files")
+    compareParser.add_argument("baseline")
+    compareParser.add_argument("candidate")
+    args = parser.parse_args(argv)
+    return {"perft": runPerft, "bench": runBench, "check": runCheck, "compare": runCompare}[args.command](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
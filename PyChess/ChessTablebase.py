@@ -0,0 +1,564 @@
+import argparse
+import mmap
+import multiprocessing
+import os
+import sys
+import time
+from collections import defaultdict
+
+import ChessBitboard
+from ChessEngine import EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK, PIECE_TYPE, PIECE_COLOR, \
+    PIECE_LETTERS
+
+## Endgame tablebases: distance to mate of every position of a small material set (up to 4 pieces),
+## one byte per position in a file named after the material ("KQvK.tb"). Tables are made by retrograde
+## analysis: one pass over all positions with BitboardGameState's legal moves finds the mates and the
+## moves that leave the table (captures, promotions), then the results are pushed back ply by ply
+## through un-moves. Reads mmap the files, so processes share one copy of each table.
+## The white side of a table is the stronger one; positions with the stronger side black are probed
+## with the board flipped. Tables ignore castling and en passant rights.
+DRAW = 0
+WIN = 1
+LOSS = -1
+## byte values: 0 draw, 1..127 side to move mates in that many plies, 128 + n side to move is mated in n plies
+LOSS_BASE = 128
+MAX_PLIES = 125
+UNRESOLVED = 254 # only while generating
+ILLEGAL = 255 # side not to move in check, two pieces on a square, pawn on the first or last rank
+ESCAPE = 255 # extLoss of a position with a move out of the table that does not lose
+MAX_PIECES = 4
+PIECE_ORDER = "KQRBNP"
+CHUNK_POSITIONS = 8192 # positions per task of the first pass
+CHUNK_FRONTIER = 2048 # resolved positions per task of the un-move passes
+
+## The 8 symmetries of the board as square maps (sq = row * 8 + col). Tables without pawns keep the
+## white king in the a1-d1-d4 triangle, tables with pawns only mirror it onto files a-d.
+def _symmetries():
+    maps = []
+    for transpose in (False, True):
+        for flipRows in (False, True):
+            for flipCols in (False, True):
+                squareMap = []
+                for sq in range(64):
+                    r, c = sq >> 3, sq & 7
+                    if transpose:
+                        r, c = c, r
+                    if flipRows:
+                        r = 7 - r
+                    if flipCols:
+                        c = 7 - c
+                    squareMap.append(r * 8 + c)
+                maps.append(squareMap)
+    return maps
+
+SYMMETRIES = _symmetries() # SYMMETRIES[0] is the identity, SYMMETRIES[1] mirrors the files
+DIAGONAL_MIRROR = SYMMETRIES[7] # reflects in the a1-h8 diagonal
+TRIANGLE = [sq for sq in range(64) if (sq & 7) <= 3 and 7 - (sq >> 3) <= (sq & 7)] # a1-d1-d4, rows count from rank 8
+HALF_BOARD = [sq for sq in range(64) if (sq & 7) <= 3]
+ORDER_KEY = [0] * 24 # sorts the pieces of a position into table order: white first, then KQRBNP
+for _code in range(24):
+    if _code & PIECE_TYPE:
+        ORDER_KEY[_code] = (0 if _code & WHITE else 8) + 6 - (_code & PIECE_TYPE)
+
+def pieceLetters(codes):
+    return "".join(PIECE_LETTERS[code & PIECE_TYPE].upper() for code in codes)
+
+def materialOf(pieces):
+    ## "KRvKN" of [(sq, code)] sorted in table order
+    white = pieceLetters(code for sq, code in pieces if code & WHITE)
+    return white + "v" + pieceLetters(code for sq, code in pieces if code & BLACK)
+
+def parseMaterial(material):
+    ## piece codes in table order of a material name, KQvK -> [wK, wQ, bK]
+    white, separator, black = material.upper().partition("V")
+    if not separator or not white.startswith("K") or not black.startswith("K") or "K" in white[1:] + black[1:] \
+            or any(letter not in PIECE_ORDER for letter in white + black):
+        raise ValueError(f"bad material {material}")
+    codes = [color | PIECE_LETTERS.index(letter.lower() if letter == "P" else letter)
+             for color, side in ((WHITE, white), (BLACK, black)) for letter in side]
+    codes.sort(key=ORDER_KEY.__getitem__)
+    return codes
+
+def strength(letters):
+    values = {"K": 0, "Q": 9, "R": 5, "B": 3, "N": 3, "P": 1}
+    return len(letters), sum(values[letter] for letter in letters), [-PIECE_ORDER.index(letter) for letter in letters]
+
+def canonicalMaterial(material):
+    ## (name of the table holding material, True if positions are probed with colours swapped)
+    codes = parseMaterial(material)
+    white = pieceLetters(code for code in codes if code & WHITE)
+    black = pieceLetters(code for code in codes if code & BLACK)
+    if strength(black) > strength(white):
+        return black + "v" + white, True
+    return white + "v" + black, False
+
+def subtables(material):
+    ## tables a capture or a promotion leads to from a table, bare kings left out
+    codes = parseMaterial(material)
+    found = set()
+    for i, code in enumerate(codes):
+        if code & PIECE_TYPE == KING:
+            continue
+        rest = codes[:i] + codes[i + 1:]
+        found.add(canonicalMaterial(materialOf([(0, c) for c in rest]))[0])
+        if code & PIECE_TYPE == PAWN:
+            for pieceType in (QUEEN, ROOK, BISHOP, KNIGHT):
+                promoted = sorted(rest + [code & PIECE_COLOR | pieceType], key=ORDER_KEY.__getitem__)
+                found.add(canonicalMaterial(materialOf([(0, c) for c in promoted]))[0])
+    found.discard("KvK")
+    return sorted(found)
+
+
+class TableLayout:
+    ## Position <-> index of one table. The index is side to move, then the white king square within the
+    ## squares its symmetry allows, then the square of every other piece in table order. Equal pieces
+    ## are stored with their squares sorted, so a position has one index.
+
+    def __init__(self, material):
+        self.material = material
+        self.codes = parseMaterial(material)
+        self.hasPawns = any(code & PIECE_TYPE == PAWN for code in self.codes)
+        firstSquares = HALF_BOARD if self.hasPawns else TRIANGLE
+        symmetries = SYMMETRIES[:2] if self.hasPawns else SYMMETRIES
+        self.firstCount = len(firstSquares)
+        self.firstIndex = [-1] * 64
+        for i, sq in enumerate(firstSquares):
+            self.firstIndex[sq] = i
+        self.firstSquares = firstSquares
+        ## a king on a1-d4 stays in the triangle when mirrored in the diagonal, so both ways are tried there
+        self.diagonal = [not self.hasPawns and DIAGONAL_MIRROR[sq] == sq for sq in range(64)]
+        ## the square map taking each white king square into firstSquares
+        self.transforms = [next(squareMap for squareMap in symmetries if squareMap[sq] in firstSquares) for sq in range(64)]
+        self.groups = [] # (start, end) of runs of equal pieces
+        start = 0
+        for i in range(1, len(self.codes) + 1):
+            if i == len(self.codes) or self.codes[i] != self.codes[start]:
+                if i - start > 1:
+                    self.groups.append((start, i))
+                start = i
+        self.sideSize = self.firstCount * 64 ** (len(self.codes) - 1)
+        self.size = 2 * self.sideSize
+
+    def index(self, squares, whiteToMove):
+        ## index of the position with the pieces of self.codes on squares
+        transform = self.transforms[squares[0]]
+        squares = [transform[sq] for sq in squares]
+        for start, end in self.groups:
+            squares[start:end] = sorted(squares[start:end])
+        if self.diagonal[squares[0]]:
+            mirrored = [DIAGONAL_MIRROR[sq] for sq in squares]
+            for start, end in self.groups:
+                mirrored[start:end] = sorted(mirrored[start:end])
+            squares = min(squares, mirrored)
+        index = self.firstIndex[squares[0]] if whiteToMove else self.firstCount + self.firstIndex[squares[0]]
+        for sq in squares[1:]:
+            index = index * 64 + sq
+        return index
+
+    def decode(self, index):
+        ## (squares, whiteToMove) of an index
+        squares = []
+        for _ in range(len(self.codes) - 1):
+            index, sq = divmod(index, 64)
+            squares.append(sq)
+        side, first = divmod(index, self.firstCount)
+        squares.append(self.firstSquares[first])
+        squares.reverse()
+        return squares, side == 0
+
+
+def decodeValue(value):
+    ## (WIN/DRAW/LOSS, plies to mate) of a stored byte
+    if value == DRAW:
+        return DRAW, 0
+    if value < LOSS_BASE:
+        return WIN, value
+    return LOSS, value - LOSS_BASE
+
+
+class Tablebases:
+    ## The tables of a directory, opened the first time a position needs them
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.tables = {} # material -> (TableLayout, mmap) or None when the file is missing
+        self.lookups = {} # material as found on a board -> (table material, colours swapped)
+        self.maxPieces = 0
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith(".tb"):
+                    self.maxPieces = max(self.maxPieces, len(name) - 4) # "KQvK.tb": 3 pieces
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+        self.tables = {}
+
+    def table(self, material):
+        if material not in self.tables:
+            path = os.path.join(self.directory, material + ".tb")
+            table = None
+            if os.path.exists(path):
+                layout = TableLayout(material)
+                with open(path, "rb") as f:
+                    if os.fstat(f.fileno()).st_size != layout.size:
+                        raise ValueError(f"{path} is not a table of {material}")
+                    table = (layout, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+            self.tables[material] = table
+        return self.tables[material]
+
+    def probe(self, gs):
+        ## (WIN/DRAW/LOSS, plies to mate) for the side to move, or None when no table covers gs
+        squares = gs.squares
+        if 64 - squares.count(EMPTY) > self.maxPieces or gs.castlingRights:
+            return None
+        pieces = [(sq, code) for sq, code in enumerate(squares) if code]
+        if gs.enpassantPossible and (WHITE | PAWN if gs.whiteToMove else BLACK | PAWN) in squares:
+            return None # an en passant capture may be the only good move, tables do not know it
+        return self.probePieces(pieces, gs.whiteToMove)
+
+    def probePieces(self, pieces, whiteToMove):
+        ## probe with the [(sq, code)] of a board
+        pieces.sort(key=lambda piece: ORDER_KEY[piece[1]])
+        material = materialOf(pieces)
+        if material == "KvK":
+            return DRAW, 0
+        lookup = self.lookups.get(material)
+        if lookup is None:
+            lookup = self.lookups[material] = canonicalMaterial(material)
+        tableMaterial, swapped = lookup
+        table = self.table(tableMaterial)
+        if table is None:
+            return None
+        layout, data = table
+        if swapped: # flip the board: black becomes white and moves up the board
+            pieces = sorted(((sq ^ 56, code ^ PIECE_COLOR) for sq, code in pieces), key=lambda piece: ORDER_KEY[piece[1]])
+            whiteToMove = not whiteToMove
+        return decodeValue(data[layout.index([sq for sq, code in pieces], whiteToMove)])
+
+
+## Generation. Every position is first looked at once, spread over a process pool in chunks of
+## indexes: illegal positions, mates and stalemates are marked, and every other position gets the
+## number of distinct positions of the table its moves lead to, the quickest win and the slowest
+## loss among its moves that leave the table, and whether one of those draws. Then, for ply 1, 2, ...
+## the un-moves of the positions resolved at the previous ply (also spread over the pool) give the
+## positions that win now, and count down the positions that run out of moves that do not lose.
+workerState = None # (BitboardGameState, Tablebases) of a worker process
+
+def initGenerator(directory):
+    global workerState
+    gs = ChessBitboard.BitboardGameState()
+    gs.squares[:] = bytes(64)
+    gs.syncSquares(range(64))
+    gs.castlingRights = 0
+    gs.enpassantPossible = ()
+    workerState = (gs, Tablebases(directory))
+
+def setPosition(gs, codes, squares, whiteToMove):
+    ## empties the board of gs and puts codes on squares
+    occupied = gs.occupied
+    while occupied:
+        low = occupied & -occupied
+        sq = low.bit_length() - 1
+        gs.squares[sq] = EMPTY
+        gs.setSquare(sq, "--")
+        occupied ^= low
+    for sq, code in zip(squares, codes):
+        gs.squares[sq] = code
+    gs.syncSquares(squares)
+    gs.whiteToMove = whiteToMove
+
+def scanPositions(task):
+    ## runs in a worker: the first pass over indexes [start, end)
+    material, start, end = task
+    gs, tablebases = workerState
+    layout = TableLayout(material)
+    codes = layout.codes
+    values = bytearray(end - start)
+    counts = bytearray(end - start)
+    extWins = bytearray(end - start)
+    extLosses = bytearray(end - start)
+    for index in range(start, end):
+        i = index - start
+        squares, whiteToMove = layout.decode(index)
+        if len(set(squares)) < len(squares) or layout.index(squares, whiteToMove) != index or \
+                any(code & PIECE_TYPE == PAWN and (sq < 8 or sq >= 56) for sq, code in zip(squares, codes)):
+            values[i] = ILLEGAL
+            continue
+        setPosition(gs, codes, squares, not whiteToMove)
+        if gs.inCheck(): # the side that just moved is in check
+            values[i] = ILLEGAL
+            continue
+        gs.whiteToMove = whiteToMove
+        moves, inCheck = gs.getLegalMoves()
+        if not moves:
+            values[i] = LOSS_BASE if inCheck else DRAW
+            continue
+        children = set()
+        extWin = 0
+        extLoss = 0
+        for move in moves:
+            packed = move.packed
+            startSq, endSq = packed >> 6 & 63, packed & 63
+            if packed >> 17 & 31 or packed >> 22 & 7: # capture or promotion: a smaller or different table
+                promotion = packed >> 22 & 7
+                pieces = []
+                for sq, code in zip(squares, codes):
+                    if sq == startSq:
+                        pieces.append((endSq, code & PIECE_COLOR | promotion if promotion else code))
+                    elif sq != endSq:
+                        pieces.append((sq, code))
+                result = tablebases.probePieces(pieces, not whiteToMove)
+                if result is None:
+                    raise RuntimeError(f"{material} needs the table of {materialOf(pieces)}") # sorted by probePieces
+                outcome, plies = result
+                if outcome == LOSS:
+                    extWin = plies + 1 if extWin == 0 else min(extWin, plies + 1)
+                elif outcome == WIN:
+                    if extLoss != ESCAPE:
+                        extLoss = max(extLoss, plies + 1)
+                else:
+                    extLoss = ESCAPE
+                continue
+            childSquares = list(squares)
+            childSquares[squares.index(startSq)] = endSq
+            children.add(layout.index(childSquares, not whiteToMove))
+        values[i] = UNRESOLVED
+        counts[i] = len(children)
+        extWins[i] = extWin
+        extLosses[i] = ESCAPE if extWin else extLoss
+    return start, bytes(values), bytes(counts), bytes(extWins), bytes(extLosses)
+
+def unmoveSquares(code, sq, occupied):
+    ## squares the piece code on sq can have come from without capturing
+    pieceType = code & PIECE_TYPE
+    empty = ~occupied
+    if pieceType == PAWN:
+        step = 8 if code & WHITE else -8
+        origins = []
+        row = (sq + step) >> 3
+        if 1 <= row <= 6 and not occupied >> (sq + step) & 1:
+            origins.append(sq + step)
+            if sq >> 3 == (4 if code & WHITE else 3) and not occupied >> (sq + 2 * step) & 1:
+                origins.append(sq + 2 * step) # double step from the second rank
+        return origins
+    if pieceType == KING:
+        targets = ChessBitboard.KING_ATTACKS[sq]
+    elif pieceType == KNIGHT:
+        targets = ChessBitboard.KNIGHT_ATTACKS[sq]
+    elif pieceType == BISHOP:
+        targets = ChessBitboard.bishopAttacks(sq, occupied)
+    elif pieceType == ROOK:
+        targets = ChessBitboard.rookAttacks(sq, occupied)
+    else:
+        targets = ChessBitboard.bishopAttacks(sq, occupied) | ChessBitboard.rookAttacks(sq, occupied)
+    targets &= empty
+    origins = []
+    while targets:
+        low = targets & -targets
+        origins.append(low.bit_length() - 1)
+        targets ^= low
+    return origins
+
+def predecessors(task):
+    ## runs in a worker: for every index, the distinct indexes of the table that have a move to it
+    material, indexes = task
+    layout = TableLayout(material)
+    codes = layout.codes
+    found = []
+    for index in indexes:
+        squares, whiteToMove = layout.decode(index)
+        occupied = 0
+        for sq in squares:
+            occupied |= 1 << sq
+        moverColor = BLACK if whiteToMove else WHITE
+        parents = set()
+        for j, code in enumerate(codes):
+            if not code & moverColor:
+                continue
+            sq = squares[j]
+            for origin in unmoveSquares(code, sq, occupied):
+                parentSquares = list(squares)
+                parentSquares[j] = origin
+                parents.add(layout.index(parentSquares, not whiteToMove))
+        found.append(list(parents))
+    return found
+
+def generateTable(material, directory, workers=1, log=None):
+    ## writes directory/<material>.tb; the tables of its captures and promotions must be there already
+    layout = TableLayout(material)
+    startTime = time.perf_counter()
+    pool = multiprocessing.Pool(workers, initializer=initGenerator, initargs=(directory,)) if workers > 1 else None
+    if pool is None:
+        initGenerator(directory)
+    mapper = pool.imap_unordered if pool is not None else map
+    try:
+        values = bytearray(layout.size)
+        counts = bytearray(layout.size)
+        extWins = bytearray(layout.size)
+        extLosses = bytearray(layout.size)
+        tasks = [(material, start, min(start + CHUNK_POSITIONS, layout.size)) for start in range(0, layout.size, CHUNK_POSITIONS)]
+        for start, chunkValues, chunkCounts, chunkWins, chunkLosses in mapper(scanPositions, tasks):
+            end = start + len(chunkValues)
+            values[start:end] = chunkValues
+            counts[start:end] = chunkCounts
+            extWins[start:end] = chunkWins
+            extLosses[start:end] = chunkLosses
+        scheduledWins = defaultdict(list) # ply -> positions winning by a move out of the table
+        scheduledLosses = defaultdict(list) # ply -> positions whose every move loses, the slowest at that ply
+        lossFrontier = []
+        for index in range(layout.size):
+            value = values[index]
+            if value == LOSS_BASE:
+                lossFrontier.append(index)
+            elif value == UNRESOLVED:
+                if extWins[index]:
+                    scheduledWins[extWins[index]].append(index)
+                elif counts[index] == 0 and extLosses[index] != ESCAPE:
+                    scheduledLosses[extLosses[index]].append(index)
+        winFrontier = []
+        ply = 0
+        while lossFrontier or winFrontier or any(key > ply for key in list(scheduledWins) + list(scheduledLosses)):
+            ply += 1
+            if ply > MAX_PLIES:
+                raise RuntimeError(f"{material} has mates longer than {MAX_PLIES} plies")
+            newWins = []
+            for parents in frontierPredecessors(mapper, material, lossFrontier):
+                for parent in parents:
+                    if values[parent] == UNRESOLVED:
+                        values[parent] = ply
+                        newWins.append(parent)
+            for index in scheduledWins.pop(ply, []):
+                if values[index] == UNRESOLVED:
+                    values[index] = ply
+                    newWins.append(index)
+            newLosses = []
+            for parents in frontierPredecessors(mapper, material, winFrontier):
+                for parent in parents:
+                    if values[parent] == UNRESOLVED:
+                        counts[parent] -= 1
+                        if counts[parent] == 0 and extLosses[parent] != ESCAPE:
+                            if extLosses[parent] <= ply:
+                                values[parent] = LOSS_BASE + ply
+                                newLosses.append(parent)
+                            else:
+                                scheduledLosses[extLosses[parent]].append(parent)
+            for index in scheduledLosses.pop(ply, []):
+                if values[index] == UNRESOLVED:
+                    values[index] = LOSS_BASE + ply
+                    newLosses.append(index)
+            lossFrontier, winFrontier = newLosses, newWins
+        if pool is not None:
+            pool.close()
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    values = values.replace(bytes([UNRESOLVED]), bytes([DRAW]))
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, material + ".tb")
+    with open(path + ".tmp", "wb") as f:
+        f.write(values)
+    os.replace(path + ".tmp", path)
+    if log is not None:
+        longest = max((plies for plies in range(1, LOSS_BASE) if bytes([plies]) in values), default=0)
+        log(f"{material}: {layout.size} positions, longest mate {longest} plies, "
+            f"{time.perf_counter() - startTime:.1f}s")
+    return path
+
+def frontierPredecessors(mapper, material, frontier):
+    tasks = [(material, frontier[start:start + CHUNK_FRONTIER]) for start in range(0, len(frontier), CHUNK_FRONTIER)]
+    for found in mapper(predecessors, tasks):
+        yield from found
+
+def generateAll(materials, directory, workers=1, log=None):
+    ## generates the tables of materials and every smaller table they need that is not in directory
+    done = set()
+    def generate(material):
+        material = canonicalMaterial(material)[0]
+        if material in done or material == "KvK":
+            return
+        for subtable in subtables(material):
+            generate(subtable)
+        if not os.path.exists(os.path.join(directory, material + ".tb")) or material in materials:
+            generateTable(material, directory, workers, log)
+        done.add(material)
+    materials = [canonicalMaterial(material)[0] for material in materials]
+    for material in materials:
+        generate(material)
+
+def allMaterials(pieces):
+    ## every table with the given number of pieces
+    found = set()
+    def extend(letters, count):
+        if count == 0:
+            white, black = letters
+            found.add(canonicalMaterial("K" + white + "vK" + black)[0])
+            return
+        for side in (0, 1):
+            for letter in PIECE_ORDER[1:]:
+                extended = list(letters)
+                extended[side] = "".join(sorted(extended[side] + letter, key=PIECE_ORDER.index))
+                extend(tuple(extended), count - 1)
+    extend(("", ""), pieces - 2)
+    return sorted(found)
+
+def runGenerate(args):
+    materials = list(args.material)
+    for pieces in args.all or []:
+        materials += allMaterials(pieces)
+    if not materials:
+        print("nothing to generate, give materials or --all", file=sys.stderr)
+        return 2
+    for material in materials:
+        if len(parseMaterial(material)) > MAX_PIECES:
+            print(f"{material}: tables go up to {MAX_PIECES} pieces", file=sys.stderr)
+            return 2
+    generateAll(materials, args.directory, args.workers, print)
+    return 0
+
+def runProbe(args):
+    tablebases = Tablebases(args.directory)
+    gs = ChessBitboard.BitboardGameState()
+    gs.loadFen(args.fen)
+    result = tablebases.probe(gs)
+    if result is None:
+        print("position not in the tablebases")
+        return 1
+    for move in gs.getValidMove():
+        gs.makeMove(move)
+        child = tablebases.probe(gs)
+        gs.undoMove()
+        print(f"{str(move):8} {describe(child, True)}")
+    print(describe(result, False))
+    return 0
+
+def describe(result, afterMove):
+    if result is None:
+        return "?"
+    outcome, plies = result
+    if afterMove: # the result of the opponent
+        outcome = -outcome
+        plies += 1
+    if outcome == DRAW:
+        return "draw"
+    return f"{'win' if outcome == WIN else 'loss'}, mate in {(plies + 1) // 2} ({plies} plies)"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate or probe endgame tablebases")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generateParser = commands.add_parser("generate", help="generate tables, with the smaller tables they need")
+    generateParser.add_argument("material", nargs="*", help="material like KQvK or KRvKN")
+    generateParser.add_argument("--all", type=int, action="append", choices=range(3, MAX_PIECES + 1),
+                                help="every table with this many pieces")
+    generateParser.add_argument("--directory", default="tablebases")
+    generateParser.add_argument("--workers", type=int, default=multiprocessing.cpu_count(), help="worker processes")
+    probeParser = commands.add_parser("probe", help="result of a position and of each of its moves")
+    probeParser.add_argument("fen")
+    probeParser.add_argument("--directory", default="tablebases")
+    args = parser.parse_args(argv)
+    return {"generate": runGenerate, "probe": runProbe}[args.command](args)
+
+if __name__ == "__main__":
+    sys.exit(main())
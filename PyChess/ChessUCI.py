@@ -0,0 +1,263 @@
+import sys
+import threading
+
+import ChessAI
+import ChessBitboard
+
+## UCI front end, so GUIs and match runners can drive the engine: python ChessUCI.py, then talk UCI on
+## stdin/stdout. The search runs in its own thread while this one keeps reading commands, so "stop",
+## "ponderhit" and "isready" are answered during a search. Threads is offered but fixed at 1: the search runs
+## in one thread.
+ENGINE_NAME = "PyChess"
+ENGINE_AUTHOR = "ZefferyH"
+CENTIPAWNS_PER_POINT = 50 # a pawn is 2 points in ChessEval.pieceScore
+MOVE_OVERHEAD = 0.05 # seconds kept back on every move for GUI and pipe latency
+MOVES_TO_GO = 30 # moves the remaining clock time is spread over when the GUI does not say
+MAX_HASH_MB = 1024
+
+def timeBudget(remaining, increment, movesToGo):
+    ## seconds to think on this move, from the clock time and increment in milliseconds
+    remaining /= 1000
+    budget = remaining / (movesToGo or MOVES_TO_GO) + increment / 1000 * 0.8
+    return max(0.01, min(budget, remaining / 2) - MOVE_OVERHEAD)
+
+def findMove(gs, notation):
+    ## the legal move of gs in coordinate notation ("e2e4", "e7e8q"), or None
+    for move in gs.getValidMove():
+        if move.getChessNotation() == notation[:4]:
+            if move.isPawnPromotion:
+                return move.withPromotion(notation[4].upper() if len(notation) > 4 else "Q")
+            return move
+    return None
+
+
+class UCIEngine:
+
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.outputLock = threading.Lock()
+        self.gs = ChessBitboard.BitboardGameState()
+        self.searchThread = None
+        self.pv = [] # moves of the last info line
+        self.stopEvent = threading.Event() # set by stop, ends the search
+        self.releaseEvent = threading.Event() # set once bestmove may be sent (infinite and ponder wait for it)
+        self.ponderTime = None # seconds to keep searching after ponderhit
+        self.ponderTimer = None
+
+    def send(self, line):
+        with self.outputLock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        ## runs one command line; False after quit
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send(f"id author {ENGINE_AUTHOR}")
+            self.send(f"option name Hash type spin default {ChessAI.TT_SIZE_MB} min 1 max {MAX_HASH_MB}")
+            self.send("option name Threads type spin default 1 min 1 max 1")
+            self.send("option name Ponder type check default false")
+            self.send("option name BookFile type string default <empty>")
+            self.send("option name TablebasePath type string default <empty>")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.setOption(args)
+        elif command == "ucinewgame":
+            self.stopSearch()
+            ChessAI.transpositionTable.clear()
+        elif command == "position":
+            self.stopSearch()
+            self.setPosition(args)
+        elif command == "go":
+            self.go(args)
+        elif command == "stop":
+            self.stopSearch()
+        elif command == "ponderhit":
+            self.ponderhit()
+        elif command == "quit":
+            self.stopSearch()
+            return False
+        return True # unknown commands are ignored, as UCI asks
+
+    def setOption(self, args):
+        ## setoption name <name> value <value>
+        if "name" not in args:
+            return
+        valueIndex = args.index("value") if "value" in args else len(args)
+        name = " ".join(args[args.index("name") + 1:valueIndex]).lower()
+        value = " ".join(args[valueIndex + 1:])
+        try:
+            if name == "hash":
+                self.stopSearch()
+                ChessAI.TT_SIZE_MB = max(1, min(int(value), MAX_HASH_MB))
+                ChessAI.transpositionTable = ChessAI.TranspositionTable(ChessAI.TT_SIZE_MB)
+            elif name == "threads":
+                if int(value) != 1:
+                    self.send("info string only Threads 1 is supported")
+            elif name == "bookfile":
+                ChessAI.loadOpeningBook(None if value in ("", "<empty>") else value)
+            elif name == "tablebasepath":
+                self.stopSearch()
+                ChessAI.loadTablebases(None if value in ("", "<empty>") else value)
+        except (ValueError, OSError):
+            self.send(f"info string bad value {value} for option {name}")
+
+    def setPosition(self, args):
+        ## position startpos|fen <fen> [moves <move>...]
+        movesIndex = args.index("moves") if "moves" in args else len(args)
+        gs = ChessBitboard.BitboardGameState()
+        if args and args[0] == "fen":
+            try:
+                gs.loadFen(" ".join(args[1:movesIndex]))
+            except (ValueError, KeyError, IndexError) as e:
+                self.send(f"info string bad FEN: {e}")
+                return
+        for notation in args[movesIndex + 1:]:
+            move = findMove(gs, notation)
+            if move is None:
+                self.send(f"info string illegal move {notation}")
+                break
+            gs.makeMove(move)
+        self.gs = gs
+
+    def go(self, args):
+        self.stopSearch()
+        params = {}
+        searchMoves = []
+        i = 0
+        while i < len(args):
+            if args[i] in ("depth", "movetime", "wtime", "btime", "winc", "binc", "movestogo", "nodes"):
+                try:
+                    params[args[i]] = int(args[i + 1])
+                except (ValueError, IndexError): # the token and its bad or missing value are skipped
+                    self.send(f"info string bad value for go {args[i]}")
+                i += 2
+                continue
+            if args[i] == "searchmoves":
+                i += 1
+                while i < len(args) and findMove(self.gs, args[i]) is not None:
+                    searchMoves.append(args[i])
+                    i += 1
+                continue
+            params[args[i]] = True # infinite, ponder
+            i += 1
+        gs = self.gs
+        try:
+            validMoves = gs.getValidMove()
+        except Exception as e: # a move generator bug must not take the engine down
+            self.send(f"info string move generation failed: {type(e).__name__}: {e}")
+            self.send("bestmove 0000")
+            return
+        if searchMoves:
+            validMoves = [move for move in validMoves if move.getUciNotation() in searchMoves or
+                          move.getChessNotation() in searchMoves]
+        if len(validMoves) == 0:
+            self.send("bestmove 0000")
+            return
+        if ChessAI.openingBook is not None and not searchMoves and "infinite" not in params and "ponder" not in params:
+            bookMove = ChessAI.openingBook.pickMove(gs, validMoves)
+            if bookMove is not None:
+                self.send("info string book move")
+                self.send(f"bestmove {bookMove.getUciNotation()}")
+                return
+        timeLimit = None
+        if "movetime" in params:
+            timeLimit = max(0.01, params["movetime"] / 1000 - MOVE_OVERHEAD)
+        elif ("wtime" if gs.whiteToMove else "btime") in params:
+            timeLimit = timeBudget(params["wtime" if gs.whiteToMove else "btime"],
+                                   params.get("winc" if gs.whiteToMove else "binc", 0), params.get("movestogo"))
+        maxDepth = params.get("depth")
+        nodeLimit = params.get("nodes")
+        waitForRelease = "infinite" in params or "ponder" in params
+        self.ponderTime = timeLimit if "ponder" in params else None
+        if waitForRelease: # search until stop, or until ponderhit and the time of the move
+            timeLimit = None
+            if maxDepth is None:
+                maxDepth = ChessAI.MAX_DEPTH
+        elif timeLimit is None and nodeLimit is None and maxDepth is None:
+            maxDepth = ChessAI.DEPTH
+        self.stopEvent.clear()
+        if waitForRelease:
+            self.releaseEvent.clear()
+        else:
+            self.releaseEvent.set()
+        self.searchThread = threading.Thread(target=self.search, args=(gs, validMoves, timeLimit, nodeLimit, maxDepth),
+                                             daemon=True)
+        self.searchThread.start()
+
+    def search(self, gs, validMoves, timeLimit, nodeLimit, maxDepth):
+        ## runs in the search thread and ends with the bestmove line
+        self.pv = []
+        context = ChessAI.SearchContext(stopEvent=self.stopEvent)
+        context.onDepth = lambda context: self.sendInfo(
+            context.info, context.principalVariation(gs, context.nextMove, context.info["depth"]))
+        rootLength = len(gs.moveLog)
+        try:
+            bestMove = context.search(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+        except Exception as e: # play the best move found so far rather than never answer
+            self.send(f"info string search failed: {type(e).__name__}: {e}")
+            while len(gs.moveLog) > rootLength:
+                gs.undoMove()
+            bestMove = context.nextMove
+        if context.info["depth"] == 0: # stopped before depth 1 finished
+            self.sendInfo(context.info, [bestMove] if bestMove is not None else [])
+        if bestMove is None:
+            bestMove = validMoves[0]
+        self.releaseEvent.wait()
+        if self.ponderTimer is not None:
+            self.ponderTimer.cancel()
+            self.ponderTimer = None
+        ponderMove = self.pv[1] if len(self.pv) > 1 and self.pv[0] == bestMove else None
+        self.send(f"bestmove {bestMove.getUciNotation()}" + (f" ponder {ponderMove.getUciNotation()}" if ponderMove else ""))
+
+    def sendInfo(self, info, pv):
+        self.pv = pv
+        score = info["score"]
+        if abs(score) >= ChessAI.MATE_SCORE: # CHECKMATE less the plies to mate
+            plies = ChessAI.CHECKMATE - abs(score)
+            scoreText = f"mate {(plies + 1) // 2 if score > 0 else -(plies // 2)}"
+        else:
+            scoreText = f"cp {score * CENTIPAWNS_PER_POINT}"
+        elapsed = info["time"]
+        self.send(f"info depth {info['depth']} score {scoreText} nodes {info['nodes']} "
+                  f"nps {int(info['nodes'] / elapsed) if elapsed > 0 else 0} time {int(elapsed * 1000)} "
+                  f"pv {' '.join(move.getUciNotation() for move in pv)}".rstrip())
+
+    def requestStop(self):
+        ## ends the running search without waiting for it; safe from any thread
+        self.stopEvent.set()
+        self.releaseEvent.set()
+
+    def stopSearch(self):
+        ## ends the running search and waits for its bestmove line
+        while self.searchThread is not None and self.searchThread.is_alive():
+            self.requestStop()
+            self.searchThread.join(0.01)
+        self.searchThread = None
+
+    def ponderhit(self):
+        ## the opponent played the expected move: the ponder search becomes a normal one on our clock
+        if self.ponderTime is not None:
+            self.ponderTimer = threading.Timer(self.ponderTime, self.requestStop)
+            self.ponderTimer.daemon = True
+            self.ponderTimer.start()
+            self.ponderTime = None
+        self.releaseEvent.set()
+
+
+def main():
+    engine = UCIEngine()
+    for line in sys.stdin:
+        if not engine.handle(line):
+            break
+    engine.stopSearch()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())